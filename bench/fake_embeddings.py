@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedder.embedding_backends import MODEL_DIMENSIONS
+
+# Simulated API behaviour
+FAKE_LATENCY_MS = float(os.getenv('FAKE_LATENCY_MS', 200))
+FAKE_LATENCY_PER_INPUT_MS = float(os.getenv('FAKE_LATENCY_PER_INPUT_MS', 0.05))
+FAKE_RPM = int(os.getenv('FAKE_RPM', 3000))
+FAKE_TPM = int(os.getenv('FAKE_TPM', 1000000))
+
+def fake_vector(text, dimensions):
+    """Deterministic unit vector for a text, so repeated runs store identical embeddings"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class RateWindow:
+    """Requests and tokens accepted over the last minute"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events = []
+        self.lock = threading.Lock()
+
+    def admit(self, tokens):
+        """Record a request, or return the seconds to wait when it exceeds a limit"""
+        with self.lock:
+            now = time.monotonic()
+            self.events = [(at, used) for at, used in self.events if now - at < 60]
+            if len(self.events) >= self.rpm or sum(used for _, used in self.events) + tokens > self.tpm:
+                return max(60 - (now - self.events[0][0]), 0.1) if self.events else 1.0
+            self.events.append((now, tokens))
+            return 0
+
+def make_server(port=0, latency_ms=None, per_input_ms=None, rpm=None, tpm=None):
+    """OpenAI-compatible /v1/embeddings server on 127.0.0.1.
+
+    Each request sleeps latency_ms plus per_input_ms per input, and requests
+    over the RPM/TPM limits get a 429 with a Retry-After header. Request
+    counts are kept in server.stats.
+    """
+    latency_ms = FAKE_LATENCY_MS if latency_ms is None else latency_ms
+    per_input_ms = FAKE_LATENCY_PER_INPUT_MS if per_input_ms is None else per_input_ms
+    window = RateWindow(rpm or FAKE_RPM, tpm or FAKE_TPM)
+    stats = {'requests': 0, 'inputs': 0, 'rate_limited': 0}
+    stats_lock = threading.Lock()
+
+    class EmbeddingsHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/embeddings'):
+                self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            texts = request['input']
+            if isinstance(texts, str):
+                texts = [texts]
+            model = request.get('model', 'text-embedding-3-small')
+            dimensions = request.get('dimensions') or MODEL_DIMENSIONS.get(model, 1536)
+            # Rough token count, close enough for rate limiting
+            tokens = sum(len(str(text)) // 4 + 1 for text in texts)
+
+            wait = window.admit(tokens)
+            if wait:
+                with stats_lock:
+                    stats['rate_limited'] += 1
+                self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                               'code': 'rate_limit_exceeded'}},
+                               {'Retry-After': f"{wait:.1f}"})
+                return
+
+            time.sleep((latency_ms + per_input_ms * len(texts)) / 1000)
+            base64_output = request.get('encoding_format') == 'base64'
+            data = []
+            for index, text in enumerate(texts):
+                vector = fake_vector(str(text), dimensions)
+                embedding = base64.b64encode(vector.tobytes()).decode('ascii') if base64_output else vector.tolist()
+                data.append({'object': 'embedding', 'index': index, 'embedding': embedding})
+            with stats_lock:
+                stats['requests'] += 1
+                stats['inputs'] += len(texts)
+            self.send_json(200, {
+                'object': 'list',
+                'data': data,
+                'model': model,
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), EmbeddingsHandler)
+    server.daemon_threads = True
+    server.stats = stats
+    return server
+
+def start_server(**settings):
+    """Run a server in a background thread. Returns (server, base_url)"""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    server = make_server(int(sys.argv[1]) if len(sys.argv) > 1 else 8089)
+    print(f"Fake embeddings API on http://127.0.0.1:{server.server_address[1]}/v1 "
+          f"({FAKE_LATENCY_MS} ms + {FAKE_LATENCY_PER_INPUT_MS} ms/input, {FAKE_RPM} RPM, {FAKE_TPM} TPM)")
+    print("Point the embedder at it with OPENAI_BASE_URL and any OPENAI_API_KEY")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{server.stats}")
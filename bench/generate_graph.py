@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+# Share of the nodes given to each label, following container/csv/model.md
+LABEL_SHARES = {
+    'Drug': 0.40,
+    'ActiveIngredient': 0.15,
+    'Excipient': 0.08,
+    'GenericGroup': 0.12,
+    'Indication': 0.10,
+    'Contraindication': 0.13,
+    'ROA': 0.01,
+    'LegalSubstanceList': 0.01,
+}
+
+# Properties written for each label, besides `id`
+LABEL_PROPERTIES = {
+    'Drug': ['name', 'theriaque_id', 'pharmacokinetics', 'single_dose_unit', 'doses_per_package',
+             'type_of_packaging', 'retail_price', 'retail_reimbursement_rate', 'dispensing_modalities',
+             'conservation', 'posologies', 'drug_interactions', 'pregnancy', 'breastfeeding',
+             'female_fertility'],
+    'ROA': ['name', 'theriaque_id'],
+    'ActiveIngredient': ['name', 'strength', 'theriaque_id'],
+    'Excipient': ['name', 'theriaque_id'],
+    'GenericGroup': ['name', 'theriaque_id'],
+    'LegalSubstanceList': ['name', 'theriaque_id'],
+    'Indication': ['name', 'details', 'theriaque_id'],
+    'Contraindication': ['type', 'theriaque_id'],
+}
+
+# Edges leaving each Drug: (edge label, target label, min, max, properties)
+DRUG_EDGES = [
+    ('IsAdministeredVia', 'ROA', 1, 2, {}),
+    ('ContainsActiveIngredient', 'ActiveIngredient', 1, 3, {}),
+    ('ContainsExcipient', 'Excipient', 2, 6, {}),
+    ('IsPartOfGenericGroup', 'GenericGroup', 1, 1, {}),
+    ('IsReferenceDrugInGroup', 'GenericGroup', 0, 1, {'relation_type': 'REFERENCE'}),
+    ('IsGenericDrugInGroup', 'GenericGroup', 0, 1, {'relation_type': 'GENERIC'}),
+    ('BelongsToLegalSubstanceList', 'LegalSubstanceList', 0, 2, {}),
+    ('HasIndication', 'Indication', 1, 5, {}),
+    ('HasContraindication', 'Contraindication', 0, 4, {}),
+]
+
+SYLLABLES = ['pa', 'ra', 'ce', 'ta', 'mol', 'ibu', 'pro', 'fen', 'amo', 'xi', 'cil', 'lin', 'met',
+             'for', 'min', 'ator', 'va', 'sta', 'tin', 'lo', 'sar', 'tan', 'ome', 'pra', 'zol', 'dex']
+FORMS = ['tablet', 'capsule', 'oral solution', 'injectable solution', 'cream', 'eye drops', 'syrup']
+CONDITIONS = ['pain', 'fever', 'hypertension', 'infection', 'migraine', 'asthma', 'diabetes',
+              'insomnia', 'allergy', 'arthritis', 'anxiety', 'nausea', 'cough', 'eczema']
+QUALIFIERS = ['acute', 'chronic', 'mild', 'severe', 'recurrent', 'pediatric', 'nocturnal']
+ROUTES = ['oral', 'intravenous', 'intramuscular', 'subcutaneous', 'topical', 'ophthalmic', 'rectal',
+          'inhaled', 'nasal', 'transdermal', 'sublingual', 'vaginal']
+LEVELS = ['CONTRE-INDICATION ABSOLUE', 'CONTRE-INDICATION RELATIVE', 'MISE EN GARDE']
+
+def label_counts(total_nodes):
+    """Number of nodes of each label, at least one per label"""
+    return {label: max(1, int(total_nodes * share)) for label, share in LABEL_SHARES.items()}
+
+def word(rng, syllables=3):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+def condition(rng):
+    return f"{rng.choice(QUALIFIERS)} {rng.choice(CONDITIONS)}"
+
+def property_value(rng, label, key, index):
+    """Synthetic value of one property. Names repeat across nodes like real product ranges do"""
+    if key == 'theriaque_id':
+        return str(100000 + index)
+    if key == 'name':
+        if label == 'Drug':
+            return f"{word(rng).upper()} {rng.choice([5, 10, 20, 50, 100, 250, 500, 1000])} mg, {rng.choice(FORMS)}"
+        if label == 'ROA':
+            return ROUTES[index % len(ROUTES)] if index < len(ROUTES) else f"{rng.choice(ROUTES)} route {index}"
+        if label == 'Indication':
+            return condition(rng)
+        if label == 'LegalSubstanceList':
+            return f"List {index + 1}"
+        return word(rng, rng.randint(2, 4))
+    if key == 'type':
+        return f"{condition(rng)} ({rng.choice(['history', 'risk', 'treatment'])})"
+    if key == 'strength':
+        return f"{rng.choice([0.5, 1, 2.5, 5, 10, 25, 50, 100])} mg"
+    if key in ('retail_price', 'retail_reimbursement_rate', 'doses_per_package'):
+        return str(rng.randint(1, 100))
+    # Free-text properties
+    return f"{rng.choice(QUALIFIERS)} {word(rng)} {rng.choice(CONDITIONS)}"
+
+def generate(total_nodes, out_dir, seed=0):
+    """Write AGE-format node and edge CSVs for about `total_nodes` nodes.
+
+    Node ids are numeric and unique across labels. Rows are written as they
+    are generated, so memory stays flat at any scale. Returns the manifest
+    that is also written to out_dir/manifest.json.
+    """
+    rng = random.Random(seed)
+    nodes_dir = os.path.join(out_dir, 'nodes')
+    edges_dir = os.path.join(out_dir, 'edges')
+    os.makedirs(nodes_dir, exist_ok=True)
+    os.makedirs(edges_dir, exist_ok=True)
+
+    counts = label_counts(total_nodes)
+    # First id of each label
+    offsets = {}
+    next_id = 1
+    for label, count in counts.items():
+        offsets[label] = next_id
+        next_id += count
+
+    start = time.time()
+    for label, count in counts.items():
+        properties = LABEL_PROPERTIES[label]
+        with open(os.path.join(nodes_dir, f"{label}.csv"), 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['id'] + properties)
+            for index in range(count):
+                writer.writerow([offsets[label] + index] +
+                                [property_value(rng, label, key, index) for key in properties])
+        print(f"Wrote {count} {label} nodes")
+
+    edge_counts = {}
+    for edge_label, target, low, high, properties in DRUG_EDGES:
+        property_names = list(properties)
+        if edge_label == 'HasContraindication':
+            property_names = ['level', 'subtypes', 'comment']
+        written = 0
+        with open(os.path.join(edges_dir, f"{edge_label}.csv"), 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['start_id', 'start_vertex_type', 'end_id', 'end_vertex_type'] + property_names)
+            for drug in range(counts['Drug']):
+                targets = rng.sample(range(counts[target]), min(rng.randint(low, high), counts[target]))
+                for target_index in targets:
+                    if edge_label == 'HasContraindication':
+                        values = [rng.choice(LEVELS), condition(rng), f"see {word(rng)}"]
+                    else:
+                        values = [properties[key] for key in property_names]
+                    writer.writerow([offsets['Drug'] + drug, 'Drug',
+                                     offsets[target] + target_index, target] + values)
+                    written += 1
+        edge_counts[edge_label] = written
+        print(f"Wrote {written} {edge_label} edges")
+
+    manifest = {
+        'nodes': counts,
+        'edges': edge_counts,
+        'total_nodes': sum(counts.values()),
+        'total_edges': sum(edge_counts.values()),
+        'seed': seed,
+        'seconds': round(time.time() - start, 2),
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage:")
+        print("  python bench/generate_graph.py <nodes> [out_dir] [seed]")
+        print("  python bench/generate_graph.py 100000 bench/csv")
+        sys.exit(1)
+    manifest = generate(
+        int(float(sys.argv[1])),
+        sys.argv[2] if len(sys.argv) > 2 else os.path.join('bench', 'csv'),
+        int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    )
+    print(f"\nGenerated {manifest['total_nodes']} nodes and {manifest['total_edges']} edges "
+          f"in {manifest['seconds']}s")
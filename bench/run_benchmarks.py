@@ -0,0 +1,250 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+from embedder.config import VECTOR_COMPACT, RERANK_FACTOR
+from embedder.db import PGDATABASE, PGHOST, PGPORT, connection, close_pool
+from embedder.retrieval import label_partitions, knn_search
+from embedder.search_service import SearchService
+from fake_embeddings import start_server
+
+# Synthetic CSVs written by generate_graph.py, and where results go
+BENCH_CSV_DIR = os.getenv('BENCH_CSV_DIR', os.path.join(BENCH_DIR, 'csv'))
+BENCH_RESULTS_DIR = os.getenv('BENCH_RESULTS_DIR', os.path.join(BENCH_DIR, 'results'))
+# Loader command; defaults to streaming the CSVs from this machine
+BENCH_LOADER_CMD = os.getenv('BENCH_LOADER_CMD', f"{sys.executable} {os.path.join(REPO_DIR, 'container', 'csv_loader.py')} stream")
+# Query scenario settings
+BENCH_QUERIES = int(os.getenv('BENCH_QUERIES', 200))
+BENCH_K = int(os.getenv('BENCH_K', 10))
+BENCH_HOPS = int(os.getenv('BENCH_HOPS', 1))
+# Comma-separated labels to restrict the searches to, searched per partition when partitioned (all labels by default)
+BENCH_LABELS = [label for label in os.getenv('BENCH_LABELS', '').split(',') if label] or None
+
+# Settings recorded with every result so runs can be compared
+RECORDED_SETTINGS = [
+    'LOADER_WORKERS', 'CHUNK_ROWS', 'EMBEDDING_CONCURRENCY', 'EMBEDDING_MAX_INPUTS', 'EMBEDDING_MAX_TOKENS',
+    'EMBEDDING_RPM', 'EMBEDDING_TPM', 'STORAGE_PROFILE', 'RERANK_FACTOR', 'VECTOR_PARTITIONING', 'VECTOR_INDEX_TYPE',
+    'HNSW_M', 'HNSW_EF_CONSTRUCTION', 'MAX_NEIGHBOURS', 'BENCH_LABELS',
+    'FAKE_LATENCY_MS', 'FAKE_LATENCY_PER_INPUT_MS', 'FAKE_RPM', 'FAKE_TPM',
+]
+
+def percentiles(latencies):
+    """p50/p95/p99 and mean of a list of latencies in milliseconds"""
+    if not latencies:
+        return {}
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(np.mean(latencies)),
+    }
+
+def read_manifest():
+    manifest_path = os.path.join(BENCH_CSV_DIR, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_result(scenario, metrics):
+    """Write one scenario's metrics, with the commit and settings they were measured on"""
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    result = {
+        'scenario': scenario,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'settings': {name: os.environ[name] for name in RECORDED_SETTINGS if name in os.environ},
+        'dataset': read_manifest(),
+        'metrics': metrics,
+    }
+    path = os.path.join(BENCH_RESULTS_DIR, f"{scenario}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as result_file:
+        json.dump(result, result_file, indent=2)
+    print(f"Results written to {path}")
+    return result
+
+def run_command(command, env=None):
+    """Run a command with its output passed through.
+
+    Returns (seconds, run summary) where the run summary is the per-stage
+    report the loader and embedder write to RUN_SUMMARY.
+    """
+    summary_path = os.path.join(BENCH_RESULTS_DIR, '.run_summary.json')
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    if os.path.exists(summary_path):
+        os.remove(summary_path)
+    start = time.perf_counter()
+    subprocess.run(command, env={**os.environ, 'RUN_SUMMARY': summary_path, **(env or {})}, cwd=REPO_DIR, check=True)
+    seconds = time.perf_counter() - start
+    if not os.path.exists(summary_path):
+        return seconds, None
+    with open(summary_path) as summary_file:
+        return seconds, json.load(summary_file)
+
+def bench_load():
+    """Wall time and rows/sec of csv_loader.py on the synthetic CSVs"""
+    manifest = read_manifest()
+    if manifest is None:
+        raise RuntimeError(f"No dataset in {BENCH_CSV_DIR}; run bench/generate_graph.py first")
+    print(f"Loading {manifest['total_nodes']} nodes and {manifest['total_edges']} edges...")
+    # The loader defaults to the in-container port, so point it at the database the benchmark uses
+    seconds, run_summary = run_command(shlex.split(BENCH_LOADER_CMD), {
+        'CSV_DIR': BENCH_CSV_DIR, 'PGHOST': PGHOST, 'PGPORT': PGPORT, 'PGDATABASE': PGDATABASE,
+    })
+    rows = manifest['total_nodes'] + manifest['total_edges']
+    return write_result('load', {
+        'seconds': seconds,
+        'rows': rows,
+        'rows_per_second': rows / seconds,
+        'command': BENCH_LOADER_CMD,
+        'stages': run_summary,
+    })
+
+# Emptied before the embed scenario, so every node is embedded instead of served as unchanged or cached
+EMBED_TABLES = ['document_vectors', 'embedding_cache', 'embedding_progress', 'embedding_sessions']
+
+def reset_embedding_tables():
+    """Truncate the embedder's vector, cache and session tables that exist"""
+    with connection() as bench_conn, bench_conn.cursor() as bench_cursor:
+        bench_cursor.execute("SELECT name FROM unnest(%s::text[]) name WHERE to_regclass(name) IS NOT NULL",
+                             (EMBED_TABLES,))
+        existing = [row[0] for row in bench_cursor.fetchall()]
+        if existing:
+            print(f"Truncating {', '.join(existing)}...")
+            bench_cursor.execute(f"TRUNCATE {', '.join(existing)}")
+
+def bench_embed():
+    """Nodes/sec of a fresh embedding session against the fake embeddings API.
+
+    The embedder's tables are truncated first, so the result measures
+    embedding and not the unchanged-hash and cache paths, and is the same on
+    every run. Cache hits can only come from names repeated within the run.
+    """
+    reset_embedding_tables()
+    with connection() as bench_conn, bench_conn.cursor() as bench_cursor:
+        bench_cursor.execute("SELECT clock_timestamp()::timestamp")
+        started_at = bench_cursor.fetchone()[0]
+    server, base_url = start_server()
+    try:
+        seconds, run_summary = run_command([sys.executable, os.path.join(REPO_DIR, 'node_embedder.py')], {
+            'OPENAI_BASE_URL': base_url,
+            'OPENAI_API_KEY': 'bench',
+            'EMBEDDING_BACKEND': 'openai',
+            'NEW_SESSION': 'true',
+        })
+    finally:
+        server.shutdown()
+
+    with connection() as bench_conn, bench_conn.cursor() as bench_cursor:
+        bench_cursor.execute("""
+            SELECT session_id, total, completed, failed FROM embedding_sessions
+            ORDER BY started_at DESC LIMIT 1
+        """)
+        session_id, total, completed, failed = bench_cursor.fetchone()
+        bench_cursor.execute("SELECT COUNT(*) FROM embedding_cache WHERE created_at < %s", (started_at,))
+        stale_cache_rows = bench_cursor.fetchone()[0]
+
+    counters = (run_summary or {}).get('counters', {})
+    unchanged = counters.get('nodes_unchanged', 0)
+    cached = counters.get('nodes_cached', 0)
+    if run_summary is None:
+        raise RuntimeError("The embedder wrote no run summary, so the unchanged and cached counts cannot be checked")
+    if unchanged or (cached and stale_cache_rows):
+        raise RuntimeError(f"{unchanged} unchanged and {cached} cached nodes were not embedded in this run; "
+                           "the result would not measure embedding")
+    return write_result('embed', {
+        'session_id': session_id,
+        'seconds': seconds,
+        'nodes': total,
+        'completed': completed,
+        'failed': failed,
+        'unchanged': unchanged,
+        'cached': cached,
+        'nodes_per_second': completed / seconds,
+        'api': dict(server.stats),
+        'stages': run_summary,
+    })
+
+def bench_query():
+    """k-NN and hybrid search latency percentiles over stored vectors used as queries.
+
+    Searches go through SearchService and the configured storage profile, so
+    they use the same distance, compact index, rerank factor and partitions as
+    the `search` command.
+    """
+    service = SearchService()
+    with connection() as bench_conn, bench_conn.cursor() as bench_cursor:
+        bench_cursor.execute("SELECT embedding FROM document_vectors ORDER BY random() LIMIT %s", (BENCH_QUERIES,))
+        queries = [row[0] for row in bench_cursor.fetchall()]
+        bench_conn.commit()
+        if not queries:
+            raise RuntimeError("document_vectors is empty; run the embed scenario first")
+
+        partitions = label_partitions(bench_cursor) if BENCH_LABELS else None
+        knn_latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            knn_search(bench_cursor, query, BENCH_K, labels=BENCH_LABELS, operator=service.operator,
+                       compact=VECTOR_COMPACT, rerank_factor=RERANK_FACTOR, partitions=partitions)
+            knn_latencies.append((time.perf_counter() - start) * 1000)
+        bench_conn.commit()
+
+    hybrid_latencies = []
+    stage_latencies = {}
+    for query in queries:
+        start = time.perf_counter()
+        _, timings = service.search_vector(query, BENCH_K, BENCH_HOPS, BENCH_LABELS)
+        hybrid_latencies.append((time.perf_counter() - start) * 1000)
+        for stage, ms in timings.items():
+            stage_latencies.setdefault(stage, []).append(ms)
+    service.close()
+
+    return write_result('query', {
+        'queries': len(queries),
+        'k': BENCH_K,
+        'hops': BENCH_HOPS,
+        'labels': BENCH_LABELS,
+        'compact': VECTOR_COMPACT,
+        'operator': service.operator,
+        'rerank_factor': RERANK_FACTOR,
+        'knn': percentiles(knn_latencies),
+        'hybrid': percentiles(hybrid_latencies),
+        'hybrid_stages': {stage: percentiles(latencies) for stage, latencies in stage_latencies.items()},
+    })
+
+SCENARIOS = {
+    'load': bench_load,
+    'embed': bench_embed,
+    'query': bench_query,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in list(SCENARIOS) + ['all']:
+        print("Usage:")
+        print("  python bench/run_benchmarks.py load    # csv_loader.py load time")
+        print("  python bench/run_benchmarks.py embed   # embedder nodes/sec against the fake API")
+        print("  python bench/run_benchmarks.py query   # k-NN and hybrid search latency")
+        print("  python bench/run_benchmarks.py all     # load, embed, then query")
+        sys.exit(1)
+    names = list(SCENARIOS) if sys.argv[1] == 'all' else [sys.argv[1]]
+    try:
+        for name in names:
+            print(f"\n=== {name} ===")
+            result = SCENARIOS[name]()
+            print(json.dumps(result['metrics'], indent=2))
+    finally:
+        close_pool()
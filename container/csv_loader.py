@@ -1,42 +1,98 @@
 from json import load
 import psycopg
 import os
+import csv
+import json
+import sys
+from itertools import islice
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-conn = psycopg.connect(
-    dbname="pgvector-age",
-    user=os.environ.get("POSTGRES_USER"),
-    password=os.environ.get("POSTGRES_PASSWORD"),
-    host="localhost",
-    port="5432"
-)
+# The metrics module is shared with the embedder: embedder/ sits next to this file's
+# directory in the repository, and next to this file in the image
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedder.metrics import Metrics
 
+GRAPH_NAME = 'from_csv'
+# Scratch graph the incoming CSVs are loaded into for a delta load
+DELTA_GRAPH_NAME = 'from_csv_delta'
+
+# CSV directory; the streaming loader reads it from the client machine
+CSV_DIR = os.environ.get("CSV_DIR", "./csv")
+NODES_DIR = os.path.join(CSV_DIR, "nodes")
+EDGES_DIR = os.path.join(CSV_DIR, "edges")
+
+# Number of label files loaded concurrently, each on its own connection
+LOADER_WORKERS = int(os.environ.get("LOADER_WORKERS", 1))
+# Rows per committed chunk in the streaming loader
+CHUNK_ROWS = int(os.environ.get("CHUNK_ROWS", 50000))
+
+# Vertex properties indexed with btree besides `id`, and memory for building indexes
+INDEX_PROPERTIES = [key for key in os.environ.get("INDEX_PROPERTIES", "name,theriaque_id").split(",") if key]
+INDEX_MAINTENANCE_WORK_MEM = os.environ.get("INDEX_MAINTENANCE_WORK_MEM", "1GB")
+
+# Connection settings; the defaults reach the database from inside the container
+PGHOST = os.environ.get("PGHOST", "localhost")
+PGPORT = os.environ.get("PGPORT", "5432")
+PGDATABASE = os.environ.get("PGDATABASE", "pgvector-age")
+
+def connect():
+    """Open a database connection with AGE loaded and the search path set"""
+    connection = psycopg.connect(
+        dbname=PGDATABASE,
+        user=os.environ.get("PGUSER", os.environ.get("POSTGRES_USER")),
+        password=os.environ.get("PGPASSWORD", os.environ.get("POSTGRES_PASSWORD")),
+        host=PGHOST,
+        port=PGPORT
+    )
+    with connection.cursor() as setup_cursor:
+        # Load the AGE extension (only needed once per session if not already loaded)
+        setup_cursor.execute("LOAD 'age';")
+        # Set the search path to include AGE
+        setup_cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
+    connection.commit()
+    return connection
+
+conn = connect()
 cursor = conn.cursor()
 
-# Load the AGE extension (only needed once per session if not already loaded)
-cursor.execute("LOAD 'age';")
-# Set the search path to include AGE
-cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
-conn.commit()
+# Stage timings and row counts, served on METRICS_PORT when set
+metrics = Metrics('csv_loader')
+metrics.serve()
 
 # Creating a new graph for the database, if it doesn't exist
-# Check if the graph exists
-cursor.execute("SELECT * FROM ag_catalog.ag_graph WHERE name = 'from_csv';")
-if cursor.fetchone() is None:
-    # Graph doesn't exist, so create it
-    cursor.execute("SELECT * FROM ag_catalog.create_graph('from_csv');")
-    conn.commit()
-    print("Created new graph 'from_csv'")
-else:
-    # Graph exists, drop it and recreate for a clean start
-    cursor.execute("SELECT * FROM ag_catalog.drop_graph('from_csv', true);") 
-    cursor.execute("SELECT * FROM ag_catalog.create_graph('from_csv');")
-    conn.commit()
-    print("Recreated graph 'from_csv'")
+def prepare_graph(graph=GRAPH_NAME, recreate=True):
+    # Check if the graph exists
+    cursor.execute("SELECT * FROM ag_catalog.ag_graph WHERE name = %s;", (graph,))
+    if cursor.fetchone() is None:
+        # Graph doesn't exist, so create it
+        cursor.execute(f"SELECT * FROM ag_catalog.create_graph('{graph}');")
+        conn.commit()
+        print(f"Created new graph '{graph}'")
+    elif recreate:
+        # Graph exists, drop it and recreate for a clean start
+        cursor.execute(f"SELECT * FROM ag_catalog.drop_graph('{graph}', true);") 
+        cursor.execute(f"SELECT * FROM ag_catalog.create_graph('{graph}');")
+        conn.commit()
+        print(f"Recreated graph '{graph}'")
+    else:
+        print(f"Using existing graph '{graph}'")
+
+def existing_labels(graph=GRAPH_NAME):
+    cursor.execute("""
+        SELECT l.name FROM ag_catalog.ag_label l
+        JOIN ag_catalog.ag_graph g ON g.graphid = l.graph
+        WHERE g.name = %s
+    """, (graph,))
+    return {row[0] for row in cursor.fetchall()}
 
 # Register vertex and edge labels
-def register_labels():
+def register_labels(graph=GRAPH_NAME):
+    registered = existing_labels(graph)
+    
     # Dynamically determine vertex labels from CSV filenames
-    nodes_dir = './csv/nodes'
+    nodes_dir = NODES_DIR
     node_types = []
     if os.path.exists(nodes_dir):
         node_types = [os.path.splitext(f)[0] for f in os.listdir(nodes_dir) if f.endswith('.csv')]
@@ -45,8 +101,11 @@ def register_labels():
     
     print("\nRegistering node labels...")
     for node_type in node_types:
+        if node_type in registered:
+            print(f"  - Label '{node_type}' already exists")
+            continue
         try:
-            cursor.execute(f"SELECT create_vlabel('from_csv', '{node_type}');")
+            cursor.execute(f"SELECT create_vlabel('{graph}', '{node_type}');")
             print(f"  - Registered '{node_type}' node label")
         except Exception as e:
             if "already exists" in str(e):
@@ -55,7 +114,7 @@ def register_labels():
                 print(f"  - Error registering '{node_type}': {str(e)}")
     
     # Dynamically determine edge labels from CSV filenames
-    edges_dir = './csv/edges'
+    edges_dir = EDGES_DIR
     edge_types = []
     if os.path.exists(edges_dir):
         edge_types = [os.path.splitext(f)[0] for f in os.listdir(edges_dir) if f.endswith('.csv')]
@@ -64,8 +123,11 @@ def register_labels():
     
     print("\nRegistering edge labels...")
     for edge_type in edge_types:
+        if edge_type in registered:
+            print(f"  - Label '{edge_type}' already exists")
+            continue
         try:
-            cursor.execute(f"SELECT create_elabel('from_csv', '{edge_type}');")
+            cursor.execute(f"SELECT create_elabel('{graph}', '{edge_type}');")
             print(f"  - Registered '{edge_type}' edge label")
         except Exception as e:
             if "already exists" in str(e):
@@ -76,85 +138,618 @@ def register_labels():
     conn.commit()
     print("All labels registered successfully")
 
-# Loading all nodes from the CSV files
-def load_nodes_from_csv():
-    csv_dir = './csv/nodes'
-    
+def list_csv_files(csv_dir):
+    """(label, absolute path) for every CSV file in csv_dir, the label being the file name"""
+    return [
+        (os.path.splitext(filename)[0], os.path.abspath(os.path.join(csv_dir, filename)))
+        for filename in sorted(os.listdir(csv_dir))
+        if filename.endswith('.csv')
+    ]
+
+def load_file(load_conn, load_function, label, file_path, graph=GRAPH_NAME):
+    """Load one label file with AGE's loader and return (rows, seconds).
+
+    Rows are the label table's inserts counted by the statistics system in
+    the load's own transaction, read before it commits, so neither the file
+    nor the table is scanned again.
+    """
+    start = time.time()
+    with load_conn.cursor() as load_cursor:
+        load_cursor.execute(f"""
+            SELECT * FROM ag_catalog.{load_function}(
+                '{graph}', 
+                '{label}', 
+                '{file_path}'
+            );
+        """)
+        load_cursor.execute("SELECT pg_stat_get_xact_tuples_inserted(to_regclass(%s))", (f'{graph}."{label}"',))
+        rows = load_cursor.fetchone()[0]
+    load_conn.commit()
+    elapsed = time.time() - start
+    metrics.observe('stage_seconds', elapsed, stage=load_function)
+    metrics.inc('rows_loaded', rows, graph=graph, label=label)
+    return rows, elapsed
+
+def load_label_files(csv_dir, load_function, graph=GRAPH_NAME):
+    """Load every label file of csv_dir, LOADER_WORKERS files at a time.
+
+    Returns (stats, failed): a list of (filename, rows, seconds) for the
+    files that loaded, and the labels whose file failed to load.
+    """
     # Check if the csv directory exists
     if not os.path.exists(csv_dir):
         print(f"Directory '{csv_dir}' not found.")
-        return
+        return [], []
+    
+    files = list_csv_files(csv_dir)
+    stats = []
+    failed = []
     
-    # Iterate through all files in the csv directory
-    for filename in os.listdir(csv_dir):
-        if filename.endswith('.csv'):
-            file_path = os.path.abspath(os.path.join(csv_dir, filename))
+    if LOADER_WORKERS <= 1:
+        for label, file_path in files:
             print(f"Processing {file_path}...")
-            
-            # Assuming the file name without extension represents the node type
-            node_type = os.path.splitext(filename)[0]
-            
-            # Read the CSV file and create nodes
             try:
-                cursor.execute(f"""
-                    SELECT * FROM ag_catalog.load_labels_from_file(
-                        'from_csv', 
-                        '{node_type}', 
-                        '{file_path}'
-                    );
-                """)
-                conn.commit()
-                print(f"Successfully loaded nodes from {filename}")
+                rows, elapsed = load_file(conn, load_function, label, file_path, graph)
+                stats.append((os.path.basename(file_path), rows, elapsed))
+                print(f"Successfully loaded {rows} rows from {os.path.basename(file_path)} in {elapsed:.1f}s")
             except Exception as e:
                 conn.rollback()
-                print(f"Error loading {filename}: {str(e)}")
+                failed.append(label)
+                print(f"Error loading {os.path.basename(file_path)}: {str(e)}")
+        return stats, failed
+    
+    # Each worker thread keeps one connection for all the files it loads
+    local = threading.local()
+    connections = []
+    connections_lock = threading.Lock()
+    
+    def load_in_worker(label, file_path):
+        if not hasattr(local, 'conn'):
+            local.conn = connect()
+            with connections_lock:
+                connections.append(local.conn)
+        try:
+            return load_file(local.conn, load_function, label, file_path, graph)
+        except Exception:
+            local.conn.rollback()
+            raise
+    
+    print(f"Loading {len(files)} files with {LOADER_WORKERS} workers...")
+    try:
+        with ThreadPoolExecutor(max_workers=LOADER_WORKERS) as executor:
+            futures = {
+                executor.submit(load_in_worker, label, file_path): (label, os.path.basename(file_path))
+                for label, file_path in files
+            }
+            for future in as_completed(futures):
+                label, filename = futures[future]
+                try:
+                    rows, elapsed = future.result()
+                    stats.append((filename, rows, elapsed))
+                    print(f"Successfully loaded {rows} rows from {filename} in {elapsed:.1f}s")
+                except Exception as e:
+                    failed.append(label)
+                    print(f"Error loading {filename}: {str(e)}")
+    finally:
+        for worker_conn in connections:
+            worker_conn.close()
+    return stats, failed
+
+def print_load_report(stats, elapsed):
+    """Per-file rows, time and throughput"""
+    print(f"\n{'File':40} {'Rows':>12} {'Time (s)':>10} {'Rows/s':>12}")
+    for filename, rows, seconds in sorted(stats, key=lambda stat: stat[2], reverse=True):
+        print(f"{filename:40} {rows:>12} {seconds:>10.1f} {rows / max(seconds, 1e-9):>12.0f}")
+    total_rows = sum(rows for _, rows, _ in stats)
+    print(f"{'Total (wall clock)':40} {total_rows:>12} {elapsed:>10.1f} {total_rows / max(elapsed, 1e-9):>12.0f}")
+
+# Loading all nodes from the CSV files
+def load_nodes_from_csv(graph=GRAPH_NAME):
+    return load_label_files(NODES_DIR, 'load_labels_from_file', graph)
+
+def load_edges_from_csv(graph=GRAPH_NAME):
+    return load_label_files(EDGES_DIR, 'load_edges_from_file', graph)
 
-def load_edges_from_csv():
-    csv_dir = './csv/edges'
+def iter_chunks(iterable, size):
+    """Yield lists of up to `size` items from an iterable"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def label_info(label):
+    """(label id, sequence name) of a label of the main graph, used to build graphids"""
+    cursor.execute("""
+        SELECT l.id, l.seq_name FROM ag_catalog.ag_label l
+        JOIN ag_catalog.ag_graph g ON g.graphid = l.graph
+        WHERE g.name = %s AND l.name = %s
+    """, (GRAPH_NAME, label))
+    return cursor.fetchone()
+
+def prepare_stream_tables(resume):
+    """Tables keeping the CSV id -> graphid mapping and the committed rows of each file"""
+    if not resume:
+        cursor.execute("DROP TABLE IF EXISTS csv_id_map")
+        cursor.execute("DROP TABLE IF EXISTS csv_load_progress")
+    # Logged like csv_load_progress: an unlogged map is emptied by crash recovery while
+    # the progress rows survive, and a resume would then drop the edges of committed vertices
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS csv_id_map (
+            label TEXT,
+            csv_id TEXT,
+            graphid graphid,
+            PRIMARY KEY (label, csv_id)
+        );
+    """)
+    cursor.execute("SELECT relpersistence = 'u' FROM pg_class WHERE oid = 'csv_id_map'::regclass")
+    if cursor.fetchone()[0]:
+        cursor.execute("ALTER TABLE csv_id_map SET LOGGED")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS csv_load_progress (
+            file_path TEXT PRIMARY KEY,
+            rows_committed BIGINT DEFAULT 0,
+            done BOOLEAN DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    if resume:
+        # A map left empty by an older unlogged table cannot resolve the committed vertices
+        cursor.execute("""
+            SELECT EXISTS (SELECT 1 FROM csv_load_progress WHERE file_path LIKE %s AND rows_committed > 0)
+               AND NOT EXISTS (SELECT 1 FROM csv_id_map)
+        """, (os.path.join(os.path.abspath(NODES_DIR), '%'),))
+        if cursor.fetchone()[0]:
+            conn.rollback()
+            raise RuntimeError("csv_load_progress has committed vertex chunks but csv_id_map is empty, "
+                               "so their edges cannot be resolved; run the stream load again without resume")
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS vertex_staging (
+            csv_id TEXT,
+            properties agtype
+        ) ON COMMIT DELETE ROWS;
+    """)
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS edge_staging (
+            start_id TEXT,
+            start_label TEXT,
+            end_id TEXT,
+            end_label TEXT,
+            properties agtype
+        ) ON COMMIT DELETE ROWS;
+    """)
+    conn.commit()
+
+def stage_vertex_chunk(label, header, rows):
+    """COPY a chunk of vertex rows into the label table, recording their graphids. Returns rows loaded"""
+    id_index = header.index('id')
+    with cursor.copy("COPY vertex_staging (csv_id, properties) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row((row[id_index], json.dumps(dict(zip(header, row)))))
     
-    # Check if the csv directory exists
+    # New graphids come from the label's own sequence, like vertices created through Cypher
+    label_id, seq_name = label_info(label)
+    cursor.execute(f"""
+        INSERT INTO csv_id_map (label, csv_id, graphid)
+        SELECT %s, csv_id, ag_catalog._graphid({label_id}, nextval('{GRAPH_NAME}."{seq_name}"'))
+        FROM vertex_staging
+    """, (label,))
+    cursor.execute(f"""
+        INSERT INTO {GRAPH_NAME}."{label}" (id, properties)
+        SELECT m.graphid, s.properties
+        FROM vertex_staging s
+        JOIN csv_id_map m ON m.label = %s AND m.csv_id = s.csv_id
+    """, (label,))
+    return cursor.rowcount
+
+def stage_edge_chunk(label, header, rows):
+    """COPY a chunk of edge rows into the label table, resolving endpoints through csv_id_map. Returns rows loaded"""
+    # AGE edge format: start_id, start_vertex_type, end_id, end_vertex_type, then properties
+    property_names = header[4:]
+    with cursor.copy("COPY edge_staging (start_id, start_label, end_id, end_label, properties) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row((row[0], row[1], row[2], row[3], json.dumps(dict(zip(property_names, row[4:])))))
+    cursor.execute(f"""
+        INSERT INTO {GRAPH_NAME}."{label}" (start_id, end_id, properties)
+        SELECT ms.graphid, me.graphid, s.properties
+        FROM edge_staging s
+        JOIN csv_id_map ms ON ms.label = s.start_label AND ms.csv_id = s.start_id
+        JOIN csv_id_map me ON me.label = s.end_label AND me.csv_id = s.end_id
+    """)
+    loaded = cursor.rowcount
+    if loaded < len(rows):
+        metrics.inc('edges_skipped', len(rows) - loaded, label=label)
+        print(f"    {len(rows) - loaded} edges skipped: endpoint not found")
+    return loaded
+
+def stream_file(label, file_path, stage_chunk):
+    """Stream one CSV file in CHUNK_ROWS chunks, committing each chunk with its progress.
+
+    A resumed load skips the rows already committed for this file.
+    Returns (rows, seconds).
+    """
+    cursor.execute("SELECT rows_committed, done FROM csv_load_progress WHERE file_path = %s", (file_path,))
+    progress = cursor.fetchone()
+    rows_committed, done = progress if progress else (0, False)
+    if done:
+        print(f"Skipping {os.path.basename(file_path)}: already loaded")
+        return 0, 0.0
+    if rows_committed:
+        print(f"Resuming {os.path.basename(file_path)} after {rows_committed} committed rows")
+    
+    start = time.time()
+    loaded = 0
+    with open(file_path, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        for chunk in iter_chunks(islice(reader, rows_committed, None), CHUNK_ROWS):
+            try:
+                with metrics.timer('stage_seconds', stage=stage_chunk.__name__):
+                    chunk_loaded = stage_chunk(label, header, chunk)
+                loaded += chunk_loaded
+                rows_committed += len(chunk)
+                cursor.execute("""
+                    INSERT INTO csv_load_progress (file_path, rows_committed)
+                    VALUES (%s, %s)
+                    ON CONFLICT (file_path) DO UPDATE SET
+                        rows_committed = EXCLUDED.rows_committed,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (file_path, rows_committed))
+                with metrics.timer('stage_seconds', stage='commit'):
+                    conn.commit()
+                metrics.inc('rows_loaded', chunk_loaded, graph=GRAPH_NAME, label=label)
+            except Exception:
+                conn.rollback()
+                raise
+            elapsed = time.time() - start
+            print(f"  {os.path.basename(file_path)}: {rows_committed} rows committed ({loaded / max(elapsed, 1e-9):.0f} rows/s)")
+    
+    cursor.execute("""
+        INSERT INTO csv_load_progress (file_path, rows_committed, done)
+        VALUES (%s, %s, TRUE)
+        ON CONFLICT (file_path) DO UPDATE SET done = TRUE, updated_at = CURRENT_TIMESTAMP
+    """, (file_path, rows_committed))
+    conn.commit()
+    return loaded, time.time() - start
+
+def stream_label_files(csv_dir, stage_chunk):
+    """Stream every label file of csv_dir. Returns a list of (filename, rows, seconds)"""
     if not os.path.exists(csv_dir):
         print(f"Directory '{csv_dir}' not found.")
-        return
+        return []
+    stats = []
+    for label, file_path in list_csv_files(csv_dir):
+        print(f"Streaming {file_path}...")
+        try:
+            rows, elapsed = stream_file(label, file_path, stage_chunk)
+            stats.append((os.path.basename(file_path), rows, elapsed))
+        except Exception as e:
+            print(f"Error loading {os.path.basename(file_path)}: {str(e)}")
+    return stats
+
+def stream_load(resume=False):
+    """Load the CSVs from this machine with chunked COPY instead of AGE's server-side file loaders.
+
+    Every chunk is committed with its progress, so `stream resume` continues
+    after the last committed chunk instead of starting over.
+    """
+    prepare_graph(GRAPH_NAME, recreate=not resume)
+    register_labels()
+    prepare_stream_tables(resume)
     
-    # Iterate through all files in the csv directory
-    for filename in os.listdir(csv_dir):
-        if filename.endswith('.csv'):
-            file_path = os.path.abspath(os.path.join(csv_dir, filename))
-            print(f"Processing {file_path}...")
-            
-            # Assuming the file name without extension represents the edge type
-            edge_type = os.path.splitext(filename)[0]
-            
-            # Read the CSV file and create edges
+    print("\nStreaming nodes...")
+    start = time.time()
+    node_stats = stream_label_files(NODES_DIR, stage_vertex_chunk)
+    print_load_report(node_stats, time.time() - start)
+    
+    print("\nStreaming edges...")
+    start = time.time()
+    edge_stats = stream_label_files(EDGES_DIR, stage_edge_chunk)
+    print_load_report(edge_stats, time.time() - start)
+    
+    create_property_indexes()
+    
+    # The mapping is only needed until every file is in
+    expected = sum(len(list_csv_files(csv_dir)) for csv_dir in (NODES_DIR, EDGES_DIR) if os.path.exists(csv_dir))
+    cursor.execute("SELECT COUNT(*) FROM csv_load_progress WHERE done")
+    if cursor.fetchone()[0] == expected:
+        cursor.execute("DROP TABLE IF EXISTS csv_id_map")
+        cursor.execute("DROP TABLE IF EXISTS csv_load_progress")
+        print("Dropped csv_id_map and csv_load_progress")
+    conn.commit()
+
+def graph_labels(kind, graph=GRAPH_NAME):
+    """Names of the vertex ('v') or edge ('e') labels of a graph"""
+    cursor.execute("""
+        SELECT l.name FROM ag_catalog.ag_label l
+        JOIN ag_catalog.ag_graph g ON g.graphid = l.graph
+        WHERE g.name = %s AND l.kind = %s
+        AND l.name NOT IN ('_ag_label_vertex', '_ag_label_edge')
+    """, (graph, kind))
+    return [row[0] for row in cursor.fetchall()]
+
+def property_index_statements(graph=GRAPH_NAME):
+    """CREATE INDEX statements for lookups on vertex properties and edge endpoints.
+
+    Btree expression indexes serve `WHERE v.id = ...` style comparisons and
+    the GIN index serves `MATCH (v:Label {id: ...})` containment matches.
+    """
+    statements = []
+    for label in graph_labels('v', graph):
+        for key in ['id'] + [key for key in INDEX_PROPERTIES if key != 'id']:
+            statements.append(f"""
+                CREATE INDEX IF NOT EXISTS "{label}_{key}_idx" ON {graph}."{label}"
+                (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"{key}"'::agtype]))
+            """)
+        statements.append(f"""
+            CREATE INDEX IF NOT EXISTS "{label}_properties_gin_idx" ON {graph}."{label}"
+            USING gin (properties)
+        """)
+    for label in graph_labels('e', graph):
+        statements.append(f'CREATE INDEX IF NOT EXISTS "{label}_start_id_idx" ON {graph}."{label}" (start_id)')
+        statements.append(f'CREATE INDEX IF NOT EXISTS "{label}_end_id_idx" ON {graph}."{label}" (end_id)')
+    return statements
+
+def create_property_indexes(graph=GRAPH_NAME):
+    """Build the property and endpoint indexes, LOADER_WORKERS at a time"""
+    statements = property_index_statements(graph)
+    conn.commit()
+    print(f"\nBuilding {len(statements)} indexes with {max(LOADER_WORKERS, 1)} workers...")
+    
+    def build(statement):
+        start = time.time()
+        with connect() as index_conn:
+            with index_conn.cursor() as index_cursor:
+                index_cursor.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+                index_cursor.execute(statement)
+            index_conn.commit()
+        elapsed = time.time() - start
+        metrics.observe('stage_seconds', elapsed, stage='create_index')
+        return elapsed
+    
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(LOADER_WORKERS, 1)) as executor:
+        futures = {executor.submit(build, statement): statement for statement in statements}
+        for future in as_completed(futures):
+            index_name = futures[future].split('"')[1]
             try:
-                cursor.execute(f"""
-                    SELECT * FROM ag_catalog.load_edges_from_file(
-                        'from_csv', 
-                        '{edge_type}', 
-                        '{file_path}'
-                    );
-                """)
-                conn.commit()
-                print(f"Successfully loaded edges from {filename}")
+                print(f"  - Built {index_name} in {future.result():.1f}s")
             except Exception as e:
-                conn.rollback()
-                print(f"Error loading {filename}: {str(e)}")
+                print(f"  - Error building {index_name}: {str(e)}")
+    
+    # Statistics for the new expression indexes live on each label table; the parents only hold inheritance totals
+    with metrics.timer('stage_seconds', stage='analyze'):
+        for label in graph_labels('v', graph) + graph_labels('e', graph):
+            cursor.execute(f'ANALYZE {graph}."{label}"')
+        cursor.execute(f"ANALYZE {graph}._ag_label_vertex")
+        cursor.execute(f"ANALYZE {graph}._ag_label_edge")
+        conn.commit()
+    print(f"Indexes built in {time.time() - start:.1f}s")
 
-# Main execution
-try:
-    # First register all labels
-    register_labels()
+def property_key(alias):
+    """SQL for the `id` property of a vertex row, used to match vertices across loads"""
+    return f"ag_catalog.agtype_access_operator(VARIADIC ARRAY[{alias}.properties, '\"id\"'::agtype])"
+
+def label_has_rows(graph, label):
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {graph}."{label}")')
+    return cursor.fetchone()[0]
+
+def check_scratch_label(label):
+    """Refuse to diff a label whose scratch copy is empty while the live label is not.
+
+    An empty scratch label means a truncated or unreadable CSV far more often
+    than a label that really lost every row, and diffing it would delete the
+    whole label.
+    """
+    if not label_has_rows(DELTA_GRAPH_NAME, label) and label_has_rows(GRAPH_NAME, label):
+        raise RuntimeError(f"scratch label {label} is empty but {GRAPH_NAME}.{label} is not; refusing to delete it")
+
+def apply_vertex_delta(label):
+    """Upsert changed and new vertices of one label and delete the ones that disappeared.
+
+    Runs in a single transaction. Vertices keep their graphid when updated,
+    and the edges of deleted vertices are deleted with them.
+    Returns (inserted, updated, deleted).
+    """
+    try:
+        check_scratch_label(label)
+        cursor.execute(f"""
+            UPDATE {GRAPH_NAME}."{label}" t
+            SET properties = s.properties
+            FROM {DELTA_GRAPH_NAME}."{label}" s
+            WHERE {property_key('t')} = {property_key('s')}
+            AND t.properties <> s.properties
+        """)
+        updated = cursor.rowcount
+        
+        cursor.execute(f"""
+            INSERT INTO {GRAPH_NAME}."{label}" (properties)
+            SELECT s.properties FROM {DELTA_GRAPH_NAME}."{label}" s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {GRAPH_NAME}."{label}" t
+                WHERE {property_key('t')} = {property_key('s')}
+            )
+        """)
+        inserted = cursor.rowcount
+        
+        cursor.execute(f"""
+            CREATE TEMP TABLE removed_vertices ON COMMIT DROP AS
+            SELECT t.id FROM {GRAPH_NAME}."{label}" t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {DELTA_GRAPH_NAME}."{label}" s
+                WHERE {property_key('s')} = {property_key('t')}
+            )
+        """)
+        # Deleting from the parent edge table covers every edge label
+        cursor.execute(f"""
+            DELETE FROM {GRAPH_NAME}._ag_label_edge e
+            USING removed_vertices r
+            WHERE e.start_id = r.id OR e.end_id = r.id
+        """)
+        cursor.execute(f"""
+            DELETE FROM {GRAPH_NAME}."{label}" t
+            USING removed_vertices r
+            WHERE t.id = r.id
+        """)
+        deleted = cursor.rowcount
+        conn.commit()
+        return inserted, updated, deleted
+    except Exception:
+        conn.rollback()
+        raise
+
+def build_vertex_map():
+    """Map every scratch-graph vertex to the vertex with the same label and id in the main graph"""
+    def vertex_keys(graph):
+        return f"""
+            SELECT v.id AS graphid, l.name AS label, {property_key('v')} AS key
+            FROM {graph}._ag_label_vertex v
+            JOIN ag_catalog.ag_label l
+              ON l.graph = (SELECT graphid FROM ag_catalog.ag_graph WHERE name = '{graph}')
+             AND l.id = ag_catalog._extract_label_id(v.id)
+        """
+    cursor.execute("DROP TABLE IF EXISTS vertex_map")
+    cursor.execute(f"""
+        CREATE TEMP TABLE vertex_map AS
+        SELECT n.graphid AS delta_id, o.graphid AS graph_id
+        FROM ({vertex_keys(DELTA_GRAPH_NAME)}) n
+        JOIN ({vertex_keys(GRAPH_NAME)}) o ON o.label = n.label AND o.key = n.key
+    """)
+    cursor.execute("CREATE INDEX ON vertex_map (delta_id)")
+    cursor.execute("ANALYZE vertex_map")
+    conn.commit()
+
+def apply_edge_delta(label):
+    """Insert new edges of one label and delete the ones that disappeared, in one transaction.
+
+    An edge is identified by its endpoints and properties, so an edge whose
+    properties changed is replaced. Returns (inserted, deleted).
+    """
+    try:
+        check_scratch_label(label)
+        cursor.execute(f"""
+            CREATE TEMP TABLE incoming_edges ON COMMIT DROP AS
+            SELECT ms.graph_id AS start_id, me.graph_id AS end_id, e.properties
+            FROM {DELTA_GRAPH_NAME}."{label}" e
+            JOIN vertex_map ms ON ms.delta_id = e.start_id
+            JOIN vertex_map me ON me.delta_id = e.end_id
+        """)
+        cursor.execute(f"""
+            DELETE FROM {GRAPH_NAME}."{label}" t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM incoming_edges i
+                WHERE i.start_id = t.start_id AND i.end_id = t.end_id AND i.properties = t.properties
+            )
+        """)
+        deleted = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO {GRAPH_NAME}."{label}" (start_id, end_id, properties)
+            SELECT i.start_id, i.end_id, i.properties FROM incoming_edges i
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {GRAPH_NAME}."{label}" t
+                WHERE t.start_id = i.start_id AND t.end_id = i.end_id AND t.properties = i.properties
+            )
+        """)
+        inserted = cursor.rowcount
+        conn.commit()
+        return inserted, deleted
+    except Exception:
+        conn.rollback()
+        raise
+
+def delta_load():
+    """Bring the graph in line with the CSVs without dropping it.
+
+    The CSVs are loaded into a scratch graph with AGE's loaders, so properties
+    are parsed exactly like a full load, then each label of the main graph is
+    diffed against it by node `id`.
+    """
+    prepare_graph(GRAPH_NAME, recreate=False)
+    register_labels(GRAPH_NAME)
+    # The id index is what the diff joins on
+    create_property_indexes(GRAPH_NAME)
     
-    # Then load nodes
-    print("\nLoading nodes...")
-    load_nodes_from_csv()
+    print(f"\nLoading CSVs into scratch graph '{DELTA_GRAPH_NAME}'...")
+    prepare_graph(DELTA_GRAPH_NAME, recreate=True)
+    register_labels(DELTA_GRAPH_NAME)
     
-    # Then load edges
-    print("\nLoading edges...")
-    load_edges_from_csv()
+    try:
+        _, failed_nodes = load_nodes_from_csv(DELTA_GRAPH_NAME)
+        _, failed_edges = load_edges_from_csv(DELTA_GRAPH_NAME)
+        # A label missing from the scratch graph would look deleted, so nothing is applied
+        if failed_nodes or failed_edges:
+            raise RuntimeError(f"delta aborted before any change, failed to load: {', '.join(failed_nodes + failed_edges)}")
+        
+        print("\nApplying node changes...")
+        for label, _ in list_csv_files(NODES_DIR) if os.path.exists(NODES_DIR) else []:
+            start = time.time()
+            try:
+                inserted, updated, deleted = apply_vertex_delta(label)
+                metrics.observe('stage_seconds', time.time() - start, stage='vertex_delta')
+                metrics.inc('delta_rows', inserted, label=label, change='inserted')
+                metrics.inc('delta_rows', updated, label=label, change='updated')
+                metrics.inc('delta_rows', deleted, label=label, change='deleted')
+                print(f"  - {label}: {inserted} inserted, {updated} updated, {deleted} deleted ({time.time() - start:.1f}s)")
+            except Exception as e:
+                print(f"  - Error applying changes to {label}: {str(e)}")
+        
+        print("\nApplying edge changes...")
+        build_vertex_map()
+        for label, _ in list_csv_files(EDGES_DIR) if os.path.exists(EDGES_DIR) else []:
+            start = time.time()
+            try:
+                inserted, deleted = apply_edge_delta(label)
+                metrics.observe('stage_seconds', time.time() - start, stage='edge_delta')
+                metrics.inc('delta_rows', inserted, label=label, change='inserted')
+                metrics.inc('delta_rows', deleted, label=label, change='deleted')
+                print(f"  - {label}: {inserted} inserted, {deleted} deleted ({time.time() - start:.1f}s)")
+            except Exception as e:
+                print(f"  - Error applying changes to {label}: {str(e)}")
+    finally:
+        conn.rollback()
+        cursor.execute(f"SELECT * FROM ag_catalog.drop_graph('{DELTA_GRAPH_NAME}', true);")
+        conn.commit()
+        print(f"\nDropped scratch graph '{DELTA_GRAPH_NAME}'")
+
+# Main execution
+try:
+    if len(sys.argv) > 1 and sys.argv[1] == "delta":
+        # Only apply what changed in the CSVs, keeping the graph online
+        delta_load()
+    elif len(sys.argv) > 1 and sys.argv[1] == "stream":
+        # Chunked client-side COPY, resumable with `stream resume`
+        stream_load(resume=len(sys.argv) > 2 and sys.argv[2] == "resume")
+    elif len(sys.argv) > 1 and sys.argv[1] == "indexes":
+        # Only create the property indexes
+        create_property_indexes()
+    else:
+        prepare_graph()
+        
+        # First register all labels
+        register_labels()
+        
+        # Then load nodes
+        print("\nLoading nodes...")
+        start = time.time()
+        node_stats, failed_nodes = load_nodes_from_csv()
+        print_load_report(node_stats, time.time() - start)
+        
+        # Then load edges, once every node exists
+        print("\nLoading edges...")
+        start = time.time()
+        edge_stats, failed_edges = load_edges_from_csv()
+        print_load_report(edge_stats, time.time() - start)
+        if failed_nodes or failed_edges:
+            print(f"Files that failed to load: {', '.join(failed_nodes + failed_edges)}")
+        
+        # Index properties once the data is in, rather than maintaining indexes row by row
+        create_property_indexes()
     
     print("\nDatabase loading completed successfully!")
+    metrics.report()
 
 except Exception as e:
     conn.rollback()
@@ -0,0 +1 @@
+# Graph vertex embedding pipeline. Run `python -m embedder --help` for the commands.
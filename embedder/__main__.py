@@ -0,0 +1,4 @@
+import sys
+from embedder.cli import main
+
+sys.exit(main(prog='python -m embedder'))
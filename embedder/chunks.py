@@ -0,0 +1,278 @@
+import json
+import os
+import string
+from embedder.config import (metrics, EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, DISTANCE_OPCLASSES,
+                             HNSW_M, HNSW_EF_CONSTRUCTION, INDEX_MAINTENANCE_WORK_MEM, vector_distance,
+                             create_embedding_backend)
+from embedder.db import connection, get_vertex_labels
+from embedder.indexes import check_vector_dimensions
+from embedder.embedding import get_encoding, estimate_tokens, content_hash, pack_embedding_batches, embed_with_split
+
+# Property chunks: per-label templates {label: {field: template}} pick the vertex
+# properties to embed besides the name. Each field is split into token-budgeted
+# chunks, and identical chunks are embedded and stored once for all nodes.
+DEFAULT_TEXT_TEMPLATES = {
+    'Drug': {
+        'pharmacokinetics': 'Pharmacokinetics: {pharmacokinetics}',
+        'posologies': 'Posology: {posologies}',
+        'drug_interactions': 'Drug interactions: {drug_interactions}',
+        'pregnancy': 'Pregnancy: {pregnancy}',
+        'breastfeeding': 'Breastfeeding: {breastfeeding}',
+        'female_fertility': 'Female fertility: {female_fertility}',
+        'conservation': 'Conservation: {conservation}',
+    },
+    'Indication': {
+        'details': 'Indication {name}: {details}',
+    },
+    'Contraindication': {
+        'type': 'Contraindication: {type}',
+    },
+}
+TEXT_TEMPLATES_FILE = os.getenv('TEXT_TEMPLATES_FILE')
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', 512))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 64))
+# Vertices read per round trip, and per committed block of chunks
+CHUNK_NODE_BATCH = int(os.getenv('CHUNK_NODE_BATCH', 5000))
+
+def load_text_templates():
+    """Templates from TEXT_TEMPLATES_FILE (JSON with the same shape) or the defaults"""
+    if TEXT_TEMPLATES_FILE:
+        with open(TEXT_TEMPLATES_FILE) as templates_file:
+            return json.load(templates_file)
+    return DEFAULT_TEXT_TEMPLATES
+
+def split_text(text, max_tokens=None, overlap=None):
+    """Split text into chunks of at most max_tokens tokens, consecutive chunks sharing `overlap` tokens.
+
+    Boundaries only depend on the text, so the same text always gives the
+    same chunks and they deduplicate across nodes.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    step = max(max_tokens - overlap, 1)
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return [text]
+        return [encoding.decode(tokens[start:start + max_tokens])
+                for start in range(0, len(tokens) - overlap, step)]
+    
+    # Without tiktoken, split on words using the conservative estimate
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    words = text.split()
+    word_tokens = [estimate_tokens(word + ' ') for word in words]
+    chunks = []
+    start = 0
+    while start < len(words):
+        end, used = start, 0
+        while end < len(words) and (end == start or used + word_tokens[end] <= max_tokens):
+            used += word_tokens[end]
+            end += 1
+        chunks.append(' '.join(words[start:end]))
+        if end == len(words):
+            break
+        # Step back over about `overlap` tokens of words
+        back, kept = end, 0
+        while back > start + 1 and kept + word_tokens[back - 1] <= overlap:
+            back -= 1
+            kept += word_tokens[back]
+        start = back
+    return chunks
+
+def template_fields(template):
+    return [field for _, field, _, _ in string.Formatter().parse(template) if field]
+
+def render_chunks(templates, properties):
+    """(field, chunk_index, text) for every chunk of a vertex.
+
+    A template is skipped when one of its properties is missing or blank.
+    """
+    for field, template in templates.items():
+        values = {name: properties.get(name) for name in template_fields(template)}
+        if any(value is None or str(value).strip() == '' for value in values.values()):
+            continue
+        for chunk_index, chunk in enumerate(split_text(template.format(**values))):
+            yield field, chunk_index, chunk
+
+def create_chunk_tables(conn):
+    """chunk_vectors holds one row per distinct chunk text, node_chunks links vertices to them"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS chunk_vectors (
+                content_hash TEXT PRIMARY KEY,
+                text TEXT,
+                embedding vector({EMBEDDING_DIMENSIONS}),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        check_vector_dimensions(cursor, 'chunk_vectors')
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS node_chunks (
+                node_id TEXT,
+                node_label TEXT,
+                field TEXT,
+                chunk_index INTEGER,
+                content_hash TEXT,
+                PRIMARY KEY (node_id, field, chunk_index)
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_node_chunks_content_hash ON node_chunks(content_hash);")
+    conn.commit()
+
+def write_chunks(write_cursor, node_ids, links, vectors):
+    """Store new chunk vectors once and replace the chunk links of the given vertices"""
+    if vectors:
+        write_cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS chunk_vectors_staging (
+                content_hash TEXT,
+                text TEXT,
+                embedding vector({EMBEDDING_DIMENSIONS})
+            ) ON COMMIT DELETE ROWS;
+        """)
+        with write_cursor.copy("""
+            COPY chunk_vectors_staging (content_hash, text, embedding) FROM STDIN WITH (FORMAT BINARY)
+        """) as copy:
+            copy.set_types(['text', 'text', 'vector'])
+            for row in vectors:
+                copy.write_row(row)
+        write_cursor.execute("""
+            INSERT INTO chunk_vectors (content_hash, text, embedding)
+            SELECT DISTINCT ON (content_hash) content_hash, text, embedding
+            FROM chunk_vectors_staging
+            ON CONFLICT (content_hash) DO NOTHING
+        """)
+    
+    write_cursor.execute("DELETE FROM node_chunks WHERE node_id = ANY(%s)", (node_ids,))
+    with write_cursor.copy("""
+        COPY node_chunks (node_id, node_label, field, chunk_index, content_hash) FROM STDIN
+    """) as copy:
+        for link in links:
+            copy.write_row(link)
+
+def process_chunk_block(conn, backend, node_label, templates, rows):
+    """Chunk, embed and store one block of (node_id, properties) rows.
+
+    Only chunk texts missing from chunk_vectors are looked up in
+    embedding_cache or sent to the API. Returns (chunks, new_texts, failed).
+    """
+    node_ids = []
+    links = []
+    texts = {}
+    for node_id, properties_text in rows:
+        try:
+            properties = json.loads(properties_text)
+        except (TypeError, ValueError):
+            continue
+        node_ids.append(node_id)
+        for field, chunk_index, text in render_chunks(templates, properties):
+            text_hash = content_hash(text)
+            links.append((node_id, node_label, field, chunk_index, text_hash))
+            texts[text_hash] = text
+    
+    with metrics.timer('stage_seconds', stage='chunk_lookup'), conn.cursor() as cursor:
+        cursor.execute("SELECT content_hash FROM chunk_vectors WHERE content_hash = ANY(%s)", (list(texts),))
+        known = {text_hash for text_hash, in cursor.fetchall()}
+        missing = [(text_hash, text) for text_hash, text in texts.items() if text_hash not in known]
+        cursor.execute("""
+            SELECT content_hash, embedding FROM embedding_cache WHERE content_hash = ANY(%s)
+        """, ([text_hash for text_hash, _ in missing],))
+        cache = dict(cursor.fetchall())
+    
+    vectors = [(text_hash, text, cache[text_hash]) for text_hash, text in missing if text_hash in cache]
+    failed = set()
+    to_embed = [item for item in missing if item[0] not in cache]
+    for batch in pack_embedding_batches(to_embed, text_of=lambda item: item[1]):
+        embedded, batch_failed = embed_with_split(backend, batch, text_of=lambda item: item[1])
+        vectors.extend((text_hash, text, embedding) for (text_hash, text), embedding in embedded)
+        for (text_hash, _), error_msg in batch_failed:
+            print(f"Error embedding chunk {text_hash[:12]}: {error_msg}")
+            failed.add(text_hash)
+    
+    # Vertices keep links only to chunks that have a vector
+    links = [link for link in links if link[4] not in failed]
+    with metrics.timer('stage_seconds', stage='chunk_write'), conn.cursor() as cursor:
+        write_chunks(cursor, node_ids, links, vectors)
+        conn.commit()
+    metrics.inc('chunks_linked', len(links))
+    metrics.inc('chunks_embedded', len(to_embed) - len(failed))
+    metrics.inc('chunks_cached', len(vectors) - (len(to_embed) - len(failed)))
+    metrics.inc('chunks_failed', len(failed))
+    return len(links), len(to_embed) - len(failed), len(failed)
+
+def embed_node_chunks(labels=None):
+    """Embed the templated properties of every vertex as deduplicated, token-budgeted chunks"""
+    print("\nEmbedding property chunks...")
+    metrics.serve()
+    # Vertices are streamed on a connection of their own, so the commits of each block keep the cursor open
+    with connection() as conn, connection() as read_conn:
+        create_chunk_tables(conn)
+        templates = load_text_templates()
+        
+        backend = create_embedding_backend()
+        print(f"Embedding with {EMBEDDING_BACKEND} backend: {EMBEDDING_MODEL} ({EMBEDDING_DIMENSIONS} dimensions)")
+        print(f"Chunks of up to {CHUNK_TOKENS} tokens, {CHUNK_OVERLAP} tokens of overlap")
+        
+        total_links = total_embedded = total_failed = 0
+        try:
+            for label_name, table_relation in get_vertex_labels(conn):
+                label_templates = templates.get(label_name)
+                if not label_templates or (labels and label_name not in labels):
+                    continue
+                print(f"{label_name}: {', '.join(label_templates)}")
+                # Same form as the node ids and labels in document_vectors
+                node_label = json.dumps([label_name])
+                with read_conn.cursor(name=f"chunks_{label_name}") as node_cursor:
+                    node_cursor.execute(f"""
+                        SELECT ag_catalog.agtype_out(ag_catalog.agtype_access_operator(
+                                   VARIADIC ARRAY[properties, '"id"'::agtype]))::text,
+                               ag_catalog.agtype_out(properties)::text
+                        FROM {table_relation}
+                    """)
+                    while True:
+                        rows = node_cursor.fetchmany(CHUNK_NODE_BATCH)
+                        if not rows:
+                            break
+                        try:
+                            links, embedded, failed = process_chunk_block(conn, backend, node_label, label_templates, rows)
+                        except Exception as e:
+                            print(f"Error processing {label_name} chunks: {str(e)}")
+                            conn.rollback()
+                            continue
+                        total_links += links
+                        total_embedded += embedded
+                        total_failed += failed
+                        print(f"  {len(rows)} vertices: {links} chunks, {embedded} newly embedded")
+                read_conn.commit()
+        finally:
+            backend.close()
+        
+        with conn.cursor() as cursor:
+            # Drop chunk texts no vertex links to anymore
+            cursor.execute("""
+                DELETE FROM chunk_vectors c
+                WHERE NOT EXISTS (SELECT 1 FROM node_chunks n WHERE n.content_hash = c.content_hash)
+            """)
+            print(f"Removed {cursor.rowcount} unused chunks")
+            conn.commit()
+            
+            # ANN index on the distinct chunks
+            conn.autocommit = True
+            try:
+                cursor.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+                cursor.execute(f"""
+                    CREATE INDEX IF NOT EXISTS chunk_vectors_embedding_hnsw_idx
+                    ON chunk_vectors USING hnsw (embedding {DISTANCE_OPCLASSES[vector_distance()]})
+                    WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+                """)
+                cursor.execute("RESET maintenance_work_mem")
+            finally:
+                conn.autocommit = False
+            
+            cursor.execute("SELECT COUNT(*) FROM chunk_vectors")
+            distinct_chunks = cursor.fetchone()[0]
+        conn.commit()
+    print(f"\n{total_links} chunks linked, {distinct_chunks} distinct chunks stored, "
+          f"{total_embedded} newly embedded, {total_failed} failed")
+    metrics.report()
@@ -0,0 +1,126 @@
+import argparse
+import sys
+
+# Commands import their module on use, so `progress` never loads numpy, tiktoken or the OpenAI client
+
+def labels_arg(value):
+    return value.split(',')
+
+def run(args):
+    command = args.command
+
+    if command in ("progress", "retry", "failures", "compact"):
+        # Session bookkeeping never reads vectors, so skip loading numpy for the pgvector adapters
+        from embedder.db import disable_vector_types
+        disable_vector_types()
+
+    if command in ("progress", "retry", "failures", "compact", "worker"):
+        # Counters for sessions recorded by older versions are built on first use
+        from embedder.sessions import ensure_session_counters
+        ensure_session_counters()
+
+    if command in (None, "incremental"):
+        from embedder.pipeline import add_vector_embeddings
+        add_vector_embeddings(incremental=command == "incremental")
+    elif command == "progress":
+        from embedder.sessions import check_embedding_progress
+        check_embedding_progress()
+    elif command == "retry":
+        from embedder.sessions import cleanup_failed_nodes
+        cleanup_failed_nodes(args.session_id)
+        print(f"Failed nodes reset for session {args.session_id}. Run without arguments to continue.")
+    elif command == "failures":
+        from embedder.sessions import get_failed_nodes_summary
+        get_failed_nodes_summary(args.session_id)
+    elif command == "compact":
+        from embedder.sessions import compact_sessions
+        compact_sessions(args.session_id)
+    elif command == "worker":
+        from embedder.pipeline import run_worker
+        run_worker(args.session_id)
+    elif command == "chunks":
+        from embedder.chunks import embed_node_chunks
+        embed_node_chunks(args.labels)
+    elif command == "propagate":
+        from embedder.graph_embeddings import propagate_embeddings
+        propagate_embeddings(args.rounds)
+    elif command == "similar-edges":
+        from embedder.graph_embeddings import build_similarity_edges
+        build_similarity_edges(k=args.k, threshold=args.threshold, labels=args.labels)
+    elif command == "index-status":
+        from embedder.indexes import check_index_status
+        check_index_status()
+    elif command == "reindex":
+        from embedder.indexes import rebuild_vector_index
+        rebuild_vector_index(args.index_type, label=args.label)
+    elif command == "partition":
+        from embedder.indexes import migrate_to_partitions
+        migrate_to_partitions()
+    elif command == "compare-profiles":
+        from embedder.search import compare_storage_profiles
+        compare_storage_profiles(k=args.k, sample_size=args.queries)
+    elif command == "search":
+        from embedder.search import search_nodes
+        search_nodes(args.query, k=args.k, hops=args.hops, labels=args.labels)
+    elif command == "batch-search":
+        from embedder.search import batch_search_nodes
+        batch_search_nodes(args.queries_file, k=args.k, hops=args.hops, labels=args.labels)
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Embed the vertices of the from_csv graph into document_vectors "
+                                                            "(starts or resumes a session when no command is given)")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    commands.add_parser('progress', help="Check all sessions progress")
+    retry = commands.add_parser('retry', help="Reset failed nodes to retry")
+    retry.add_argument('session_id')
+    failures = commands.add_parser('failures', help="Show failure summary")
+    failures.add_argument('session_id')
+    commands.add_parser('incremental', help="Embed only new or changed nodes")
+    worker = commands.add_parser('worker', help="Join a session as an extra worker")
+    worker.add_argument('session_id', nargs='?')
+    compact = commands.add_parser('compact', help="Drop completed rows of finished sessions")
+    compact.add_argument('session_id', nargs='?')
+    chunks = commands.add_parser('chunks', help="Embed templated properties as deduplicated chunks")
+    chunks.add_argument('labels', nargs='?', type=labels_arg, metavar='Label,...')
+    propagate = commands.add_parser('propagate', help="Graph-averaged vectors into graph_embedding")
+    propagate.add_argument('rounds', nargs='?', type=int)
+    similar = commands.add_parser('similar-edges', help="k-NN pairs as SIMILAR_TO edges")
+    similar.add_argument('k', nargs='?', type=int)
+    similar.add_argument('threshold', nargs='?', type=float)
+    similar.add_argument('labels', nargs='?', type=labels_arg, metavar='Label,...')
+    commands.add_parser('index-status', help="Show vector index size and build progress")
+    reindex = commands.add_parser('reindex', help="Rebuild the vector index online")
+    reindex.add_argument('index_type', nargs='?', choices=['hnsw', 'ivfflat'])
+    reindex.add_argument('label', nargs='?', metavar='Label')
+    commands.add_parser('partition', help="Partition document_vectors by label")
+    search = commands.add_parser('search', help="Vector + graph search")
+    search.add_argument('query', help="Query text, or a JSON vector")
+    search.add_argument('k', nargs='?', type=int, default=10)
+    search.add_argument('hops', nargs='?', type=int, default=1)
+    search.add_argument('labels', nargs='?', type=labels_arg, metavar='Label,...')
+    batch = commands.add_parser('batch-search', help="Vector + graph search for every line of a file")
+    batch.add_argument('queries_file', help="One query per line, - for stdin")
+    batch.add_argument('k', nargs='?', type=int, default=10)
+    batch.add_argument('hops', nargs='?', type=int, default=1)
+    batch.add_argument('labels', nargs='?', type=labels_arg, metavar='Label,...')
+    profiles = commands.add_parser('compare-profiles', help="Recall/latency per storage profile")
+    profiles.add_argument('k', nargs='?', type=int, default=10)
+    profiles.add_argument('queries', nargs='?', type=int, default=100)
+    return parser
+
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
+    from embedder.db import close_pool
+    try:
+        run(args)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        print("Connection was rolled back")
+        return 1
+    finally:
+        close_pool()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
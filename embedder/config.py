@@ -0,0 +1,91 @@
+import os
+from dotenv import load_dotenv
+from embedder.metrics import Metrics
+from embedder.embedding_backends import DEFAULT_LOCAL_MODEL, model_dimensions
+
+load_dotenv()
+
+# Stage timings and node counters, served on METRICS_PORT while embedding
+metrics = Metrics('node_embedder')
+
+# Embedding backend: the OpenAI API, or a local model on CPU
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')
+if EMBEDDING_BACKEND == 'local':
+    EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', DEFAULT_LOCAL_MODEL)
+else:
+    EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Storage profiles: (dimensions requested from the model, compact representation).
+# The compact representation (halfvec or binary-quantized bit) is what the ANN
+# index stores; searches re-rank its candidates against the full-precision column.
+# None dimensions keep the model's native size.
+STORAGE_PROFILES = {
+    'full': (None, None),
+    'halfvec': (None, 'halfvec'),
+    'binary': (None, 'bit'),
+    'small': (512, 'halfvec'),
+}
+STORAGE_PROFILE = os.getenv('STORAGE_PROFILE', 'full')
+# document_vectors follows the backend's dimensionality; unlisted local models report their own
+# (or set LOCAL_EMBEDDING_DIMENSIONS to skip loading the model here)
+EMBEDDING_DIMENSIONS = (
+    STORAGE_PROFILES[STORAGE_PROFILE][0]
+    or int(os.getenv('LOCAL_EMBEDDING_DIMENSIONS', 0))
+    or model_dimensions(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+)
+VECTOR_COMPACT = STORAGE_PROFILES[STORAGE_PROFILE][1]
+# Candidates fetched from the compact index per result before exact re-ranking
+RERANK_FACTOR = int(os.getenv('RERANK_FACTOR', 4))
+# Graph neighbours kept per k-NN hit in hybrid search, fewest hops first
+MAX_NEIGHBOURS = int(os.getenv('MAX_NEIGHBOURS', 50))
+# Create document_vectors LIST-partitioned by node_label, with one partition and ANN index per vertex label
+VECTOR_PARTITIONING = os.getenv('VECTOR_PARTITIONING', '').lower() in ['true', '1', 'yes', 'y']
+# Embedding request limits (OpenAI allows up to 2048 inputs and 300k tokens per request)
+EMBEDDING_MAX_INPUTS = int(os.getenv('EMBEDDING_MAX_INPUTS', 2048))
+EMBEDDING_MAX_TOKENS = int(os.getenv('EMBEDDING_MAX_TOKENS', 250000))
+
+# Concurrent mode: number of requests in flight and account rate limits
+EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', 1))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', 3000))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', 1000000))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 8))
+
+# Distance used by each model. OpenAI embeddings are normalized, so cosine
+# distance ranks them the same way as inner product
+MODEL_DISTANCES = {
+    "text-embedding-3-small": "cosine",
+    "text-embedding-3-large": "cosine",
+    "text-embedding-ada-002": "cosine",
+}
+DISTANCE_OPCLASSES = {
+    "cosine": "vector_cosine_ops",
+    "l2": "vector_l2_ops",
+    "ip": "vector_ip_ops",
+}
+DISTANCE_OPERATORS = {
+    "cosine": "<=>",
+    "l2": "<->",
+    "ip": "<#>",
+}
+
+# ANN index settings
+VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'hnsw')
+HNSW_M = int(os.getenv('HNSW_M', 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 64))
+IVFFLAT_LISTS = int(os.getenv('IVFFLAT_LISTS', 0))  # 0 picks a value from the row count
+INDEX_MAINTENANCE_WORK_MEM = os.getenv('INDEX_MAINTENANCE_WORK_MEM', '2GB')
+INDEX_PARALLEL_WORKERS = int(os.getenv('INDEX_PARALLEL_WORKERS', 7))
+# Sessions with at least this many pending nodes drop the index and build it after loading
+BULK_INDEX_THRESHOLD = int(os.getenv('BULK_INDEX_THRESHOLD', 100000))
+
+def vector_distance():
+    return MODEL_DISTANCES.get(EMBEDDING_MODEL, "cosine")
+
+def create_embedding_backend(concurrent=False):
+    """Backend for the configured model. In concurrent mode the rate limiter handles 429s itself,
+    so the client's own retries are disabled"""
+    from embedder.embedding_backends import create_backend
+    return create_backend(
+        EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS,
+        max_retries=0 if concurrent and EMBEDDING_CONCURRENCY > 1 else None
+    )
@@ -0,0 +1,102 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from psycopg.conninfo import make_conninfo
+
+load_dotenv()
+
+# Graph the embedder reads vertices and edges from
+GRAPH_NAME = 'from_csv'
+
+# Connection settings (defaults match the docker-compose database)
+PGDATABASE = os.getenv('PGDATABASE', 'pgvector-age')
+PGHOST = os.getenv('PGHOST', 'localhost')
+PGPORT = os.getenv('PGPORT', '5431')
+# Connections kept open by the pool; an embedding run uses up to three at once
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Register the pgvector adapters on every new connection (needs numpy)
+_vector_types = True
+
+def conninfo():
+    return make_conninfo(
+        dbname=PGDATABASE,
+        user=os.environ.get("PGUSER"),
+        password=os.environ.get("PGPASSWORD"),
+        host=PGHOST,
+        port=PGPORT
+    )
+
+def configure(connection):
+    """Per-connection setup: load AGE, put ag_catalog on the search path and register the vector types"""
+    with connection.cursor() as setup_cursor:
+        setup_cursor.execute("LOAD 'age';")
+        setup_cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
+    connection.commit()
+    if _vector_types:
+        from psycopg import ProgrammingError
+        try:
+            register_vector(connection)
+        except ProgrammingError:
+            # The vector extension doesn't exist yet; the embedding run registers it after creating it
+            pass
+        connection.rollback()
+
+def disable_vector_types():
+    """Skip the pgvector adapters on connections opened from now on, for commands that never read vectors"""
+    global _vector_types
+    _vector_types = False
+
+def reset(connection):
+    """Undo per-operation connection settings before the connection goes back to the pool"""
+    connection.autocommit = False
+    connection.isolation_level = None
+
+def get_pool():
+    """The process-wide connection pool, opened on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from psycopg_pool import ConnectionPool
+            _pool = ConnectionPool(
+                conninfo(), min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                configure=configure, reset=reset, open=True, name='node_embedder'
+            )
+        return _pool
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; it is committed on success and rolled back on error"""
+    with get_pool().connection() as pooled:
+        yield pooled
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def register_vector(conn):
+    """Load the pgvector type adapters on a connection (the extension must exist).
+
+    Pooled connections get them in configure; this is only needed right after
+    creating the extension.
+    """
+    from pgvector.psycopg import register_vector as register
+    register(conn)
+
+def get_vertex_labels(conn):
+    """Return (name, relation) for every vertex label of the from_csv graph"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT name, relation
+            FROM ag_catalog.ag_label
+            WHERE kind = 'v' AND name != '_ag_label_vertex'
+            AND graph = (SELECT graphid FROM ag_catalog.ag_graph WHERE name = %s)
+        """, (GRAPH_NAME,))
+        return cursor.fetchall()
@@ -0,0 +1,197 @@
+import hashlib
+import random
+import threading
+import time
+from openai import APIConnectionError, BadRequestError, InternalServerError, RateLimitError
+from embedder.config import (metrics, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_MAX_INPUTS,
+                             EMBEDDING_MAX_TOKENS, EMBEDDING_MAX_RETRIES)
+
+_encoding = None
+_encoding_loaded = False
+
+def get_encoding():
+    """The cl100k_base tokenizer, loaded on first use; None without tiktoken"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+def estimate_tokens(text):
+    """Count tokens with tiktoken when available, otherwise use a conservative estimate"""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 3 + 1
+
+def node_text(node_label, node_name):
+    """Text sent to the embedding model for a node"""
+    return f"{node_label}: {node_name}"
+
+def content_hash(text):
+    """Cache key for an embedding: hash of the model, dimensions and exact input text"""
+    key = f"{EMBEDDING_MODEL}\n{EMBEDDING_DIMENSIONS}\n{text}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def default_text(node):
+    node_id, node_name, node_label = node
+    return node_text(node_label, node_name or '')
+
+def pack_embedding_batches(nodes, max_inputs=None, max_tokens=None, text_of=default_text):
+    """Group nodes into request-sized batches bounded by input count and token budget"""
+    max_inputs = max_inputs or EMBEDDING_MAX_INPUTS
+    max_tokens = max_tokens or EMBEDDING_MAX_TOKENS
+    batch = []
+    batch_tokens = 0
+    for node in nodes:
+        tokens = estimate_tokens(text_of(node))
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(node)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+class RateLimiter:
+    """Token buckets enforcing both requests-per-minute and tokens-per-minute.
+
+    A 429 halves the allowed rate and pauses every caller for the Retry-After
+    delay; each successful request then restores a little of the rate.
+    """
+
+    def __init__(self, rpm, tpm, min_rate=0.05):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rate = 1.0
+        self.min_rate = min_rate
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm * self.rate / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm * self.rate / 60)
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens are available"""
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.requests >= 1 and self.tokens >= tokens:
+                        self.requests -= 1
+                        self.tokens -= tokens
+                        return
+                    wait = max(
+                        (1 - self.requests) * 60 / (self.rpm * self.rate),
+                        (tokens - self.tokens) * 60 / (self.tpm * self.rate)
+                    )
+            time.sleep(min(max(wait, 0.01), 5))
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(1.0, self.rate + 0.02)
+
+    def on_rate_limited(self, retry_after):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+def retry_after_seconds(error, attempt):
+    """Delay requested by a 429 response, or exponential backoff with jitter"""
+    response = getattr(error, 'response', None)
+    headers = response.headers if response is not None else {}
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return min(60, 2 ** attempt) * (0.5 + random.random() / 2)
+
+def timed_embed(backend, texts, tokens):
+    """One backend call, recorded with its latency and token count"""
+    metrics.inc('api_requests')
+    metrics.inc('tokens_sent', tokens)
+    with metrics.timer('stage_seconds', stage='api_request'):
+        return backend.embed(texts)
+
+def embed_texts(backend, texts, limiter=None):
+    """Embed several texts in one call, returning vectors in input order"""
+    tokens = sum(estimate_tokens(text) for text in texts)
+    if limiter is None or not backend.rate_limited:
+        return timed_embed(backend, texts, tokens)
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        with metrics.timer('stage_seconds', stage='rate_limit_wait'):
+            limiter.acquire(tokens)
+        try:
+            embeddings = timed_embed(backend, texts, tokens)
+        except RateLimitError as e:
+            metrics.inc('rate_limited_responses')
+            # Quota exhaustion will not recover by waiting
+            if getattr(e, 'code', None) == 'insufficient_quota' or attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            metrics.inc('api_retries')
+            limiter.on_rate_limited(retry_after_seconds(e, attempt))
+            continue
+        except (APIConnectionError, InternalServerError) as e:
+            # Timeouts, dropped connections and 5xx: the client's own retries are off in this mode
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            metrics.inc('api_retries')
+            with metrics.timer('stage_seconds', stage='retry_wait'):
+                time.sleep(retry_after_seconds(e, attempt))
+            continue
+        limiter.on_success()
+        return embeddings
+
+def embed_unique(backend, nodes, limiter=None):
+    """Embed each distinct text once and share the vector with every node that has it"""
+    by_text = {}
+    for node in nodes:
+        by_text.setdefault(node_text(node[2], node[1]), []).append(node)
+    embedded, failed = embed_with_split(backend, [group[0] for group in by_text.values()], limiter)
+    metrics.inc('duplicate_texts', len(nodes) - len(by_text))
+    return (
+        [(node, embedding) for first, embedding in embedded for node in by_text[node_text(first[2], first[1])]],
+        [(node, error_msg) for first, error_msg in failed for node in by_text[node_text(first[2], first[1])]]
+    )
+
+def embed_with_split(backend, nodes, limiter=None, text_of=default_text):
+    """Embed a batch of nodes, splitting it in half on rejected input.
+
+    Returns (embedded, failed) where embedded is a list of (node, embedding)
+    and failed is a list of (node, error_message), so one bad input only
+    fails itself instead of the whole request.
+    """
+    if not nodes:
+        return [], []
+    texts = [text_of(node) for node in nodes]
+    try:
+        embeddings = embed_texts(backend, texts, limiter)
+    except BadRequestError as e:
+        if len(nodes) == 1:
+            return [], [(nodes[0], str(e))]
+        metrics.inc('batch_splits')
+        middle = len(nodes) // 2
+        left_embedded, left_failed = embed_with_split(backend, nodes[:middle], limiter, text_of)
+        right_embedded, right_failed = embed_with_split(backend, nodes[middle:], limiter, text_of)
+        return left_embedded + right_embedded, left_failed + right_failed
+    except Exception as e:
+        # Not caused by a specific input (network, auth, rate limit): fail the whole batch
+        return [], [(node, str(e)) for node in nodes]
+    return list(zip(nodes, embeddings)), []
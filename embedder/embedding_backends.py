@@ -0,0 +1,136 @@
+import os
+
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Native output size of the models we know about
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "sentence-transformers/all-mpnet-base-v2": 768,
+    "BAAI/bge-small-en-v1.5": 384,
+    "BAAI/bge-base-en-v1.5": 768,
+    "intfloat/multilingual-e5-small": 384,
+}
+
+_encoders = {}
+
+def load_encoder(model):
+    """sentence-transformers model on CPU, loaded once per process"""
+    if model not in _encoders:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("The local embedding backend needs sentence-transformers: pip install sentence-transformers")
+        _encoders[model] = SentenceTransformer(model, device='cpu')
+    return _encoders[model]
+
+def model_dimensions(backend, model):
+    """Native output size of model: from the table above, or reported by a local model itself"""
+    if model in MODEL_DIMENSIONS:
+        return MODEL_DIMENSIONS[model]
+    if backend == 'local':
+        try:
+            return load_encoder(model).get_sentence_embedding_dimension()
+        except ImportError as e:
+            raise ValueError(f"Cannot read the output size of local model '{model}' ({e}); "
+                             "set LOCAL_EMBEDDING_DIMENSIONS to it") from e
+    raise ValueError(f"Unknown dimensions for embedding model '{model}'; "
+                     "add it to MODEL_DIMENSIONS in embedder/embedding_backends.py")
+
+class EmbeddingBackend:
+    """Turns a list of texts into vectors returned in input order"""
+
+    model = None
+    dimensions = None
+    # Whether calls go through the RPM/TPM rate limiter
+    rate_limited = False
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class OpenAIBackend(EmbeddingBackend):
+    """OpenAI embeddings API, asking for shortened vectors when fewer dimensions are configured"""
+
+    rate_limited = True
+
+    def __init__(self, model="text-embedding-3-small", dimensions=None, max_retries=None):
+        from openai import OpenAI
+        self.model = model
+        self.native_dimensions = model_dimensions('openai', model)
+        self.dimensions = dimensions or self.native_dimensions
+        if max_retries is None:
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        else:
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=max_retries)
+
+    def embed(self, texts):
+        if self.dimensions != self.native_dimensions:
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts,
+                dimensions=self.dimensions
+            )
+        else:
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts
+            )
+        embeddings = [None] * len(texts)
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        return embeddings
+
+class LocalBackend(EmbeddingBackend):
+    """sentence-transformers model running on CPU.
+
+    Large batches are spread over a pool of worker processes, one per core
+    by default. sentence-transformers sorts each batch by length so padding
+    stays small, and vectors come back as a float32 numpy array that the
+    binary COPY writes without conversion.
+    """
+
+    def __init__(self, model=DEFAULT_LOCAL_MODEL, dimensions=None, workers=None, batch_size=64):
+        self.model = model
+        self.encoder = load_encoder(model)
+        self.dimensions = self.encoder.get_sentence_embedding_dimension()
+        if dimensions and dimensions != self.dimensions:
+            raise ValueError(f"{model} produces {self.dimensions}-dimensional vectors, not {dimensions}")
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.pool = None
+
+    def embed(self, texts):
+        import numpy as np
+        if self.workers > 1 and len(texts) >= self.batch_size * self.workers:
+            if self.pool is None:
+                self.pool = self.encoder.start_multi_process_pool(target_devices=['cpu'] * self.workers)
+            vectors = self.encoder.encode_multi_process(
+                texts, self.pool, batch_size=self.batch_size, normalize_embeddings=True
+            )
+        else:
+            vectors = self.encoder.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+            )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def close(self):
+        if self.pool is not None:
+            self.encoder.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+def create_backend(name, model, dimensions=None, max_retries=None):
+    """Build the embedding backend called `name` ('openai' or 'local')"""
+    if name == 'openai':
+        return OpenAIBackend(model, dimensions, max_retries)
+    if name == 'local':
+        return LocalBackend(
+            model, dimensions,
+            workers=int(os.getenv('LOCAL_EMBEDDING_WORKERS', 0)) or None,
+            batch_size=int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', 64))
+        )
+    raise ValueError(f"Unknown embedding backend '{name}' (expected openai or local)")
@@ -0,0 +1,306 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import psycopg
+from embedder.config import metrics, EMBEDDING_DIMENSIONS
+from embedder.db import GRAPH_NAME, connection, get_vertex_labels
+from embedder.indexes import create_graph_embedding_index
+from embedder.propagation import build_adjacency, propagate, normalize_matrix, block_top_k, unique_pairs
+from embedder.retrieval import label_filter_values, label_name
+
+# Graph propagation: neighbourhood-averaged vectors stored in document_vectors.graph_embedding
+PROPAGATION_ROUNDS = int(os.getenv('PROPAGATION_ROUNDS', 2))
+PROPAGATION_SELF_WEIGHT = float(os.getenv('PROPAGATION_SELF_WEIGHT', 0.5))
+# Rows per block and edges per gather, which bound memory use besides the memory-mapped matrices
+PROPAGATION_BLOCK_ROWS = int(os.getenv('PROPAGATION_BLOCK_ROWS', 50000))
+PROPAGATION_MAX_EDGES = int(os.getenv('PROPAGATION_MAX_EDGES', 100000))
+# Where the memory-mapped matrices live (the system temp directory by default)
+PROPAGATION_DIR = os.getenv('PROPAGATION_DIR')
+
+def load_vector_matrix(read_conn, path, labels=None):
+    """Stream document_vectors (optionally only some labels) into a float32 memmap at path.
+
+    Returns (keys, matrix) where keys holds the (id, node_label) of each row;
+    ids are only unique within a label.
+    """
+    label_clause = "WHERE node_label = ANY(%s)" if labels else ""
+    params = (label_filter_values(labels),) if labels else ()
+    with read_conn.cursor() as count_cursor:
+        count_cursor.execute(f"SELECT COUNT(*) FROM document_vectors {label_clause}", params)
+        node_count = count_cursor.fetchone()[0]
+    matrix = np.memmap(path, dtype=np.float32, mode='w+', shape=(max(node_count, 1), EMBEDDING_DIMENSIONS))
+    keys = []
+    with read_conn.cursor(name="propagation_vectors") as vector_cursor:
+        vector_cursor.execute(f"SELECT id, node_label, embedding FROM document_vectors {label_clause}", params)
+        while True:
+            rows = vector_cursor.fetchmany(PROPAGATION_BLOCK_ROWS)
+            if not rows:
+                break
+            matrix[len(keys):len(keys) + len(rows)] = np.stack([np.asarray(embedding, dtype=np.float32)
+                                                               for _, _, embedding in rows])
+            keys.extend((node_id, node_label) for node_id, node_label, _ in rows)
+    return keys, matrix
+
+def load_edge_rows(read_conn, row_of):
+    """Matrix row indices of both endpoints of every edge whose endpoints have vectors.
+
+    row_of maps (id, bare label) to a row, since ids are only unique within a label.
+    """
+    sources = array('q')
+    targets = array('q')
+    with read_conn.cursor(name="propagation_edges") as edge_cursor:
+        # Edges reference graphids; their endpoints' `id` property and label are what document_vectors is keyed by
+        edge_cursor.execute(f"""
+            SELECT ag_catalog.agtype_out(ag_catalog.agtype_access_operator(
+                       VARIADIC ARRAY[s.properties, '"id"'::agtype]))::text,
+                   sl.name,
+                   ag_catalog.agtype_out(ag_catalog.agtype_access_operator(
+                       VARIADIC ARRAY[t.properties, '"id"'::agtype]))::text,
+                   tl.name
+            FROM {GRAPH_NAME}._ag_label_edge e
+            JOIN {GRAPH_NAME}._ag_label_vertex s ON s.id = e.start_id
+            JOIN ag_catalog.ag_label sl ON sl.relation = s.tableoid::regclass
+            JOIN {GRAPH_NAME}._ag_label_vertex t ON t.id = e.end_id
+            JOIN ag_catalog.ag_label tl ON tl.relation = t.tableoid::regclass
+        """)
+        while True:
+            rows = edge_cursor.fetchmany(PROPAGATION_MAX_EDGES)
+            if not rows:
+                break
+            for start_id, start_label, end_id, end_label in rows:
+                source = row_of.get((start_id, start_label))
+                target = row_of.get((end_id, end_label))
+                if source is not None and target is not None and source != target:
+                    sources.append(source)
+                    targets.append(target)
+    return np.frombuffer(sources, dtype=np.int64), np.frombuffer(targets, dtype=np.int64)
+
+def write_graph_embeddings(conn, keys, matrix):
+    """Store the propagated vectors in document_vectors.graph_embedding, one block per transaction"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS graph_vectors_staging (
+                id TEXT,
+                node_label TEXT,
+                embedding vector({EMBEDDING_DIMENSIONS})
+            ) ON COMMIT DELETE ROWS;
+        """)
+        for start in range(0, len(keys), PROPAGATION_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + PROPAGATION_BLOCK_ROWS], dtype=np.float32)
+            with cursor.copy("""
+                COPY graph_vectors_staging (id, node_label, embedding) FROM STDIN WITH (FORMAT BINARY)
+            """) as copy:
+                copy.set_types(['text', 'text', 'vector'])
+                for (node_id, node_label), embedding in zip(keys[start:start + PROPAGATION_BLOCK_ROWS], block):
+                    copy.write_row((node_id, node_label, embedding))
+            cursor.execute("""
+                UPDATE document_vectors d
+                SET graph_embedding = s.embedding
+                FROM graph_vectors_staging s
+                WHERE d.id = s.id AND d.node_label = s.node_label
+            """)
+            conn.commit()
+
+def propagate_embeddings(rounds=None):
+    """Compute graph-propagated embeddings locally, without API calls.
+
+    Vectors and the from_csv adjacency are loaded into memory-mapped numpy
+    matrices, then each round replaces every vector with a normalized mix
+    of itself and the mean of its neighbours (GraphSAGE-mean style). Short,
+    ambiguous names such as ROA or Excipient pick up their context this way.
+    """
+    rounds = PROPAGATION_ROUNDS if rounds is None else rounds
+    print(f"\nPropagating embeddings over the graph ({rounds} rounds, self weight {PROPAGATION_SELF_WEIGHT})...")
+    metrics.serve()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE document_vectors ADD COLUMN IF NOT EXISTS graph_embedding vector({EMBEDDING_DIMENSIONS});")
+        conn.commit()
+    
+    with tempfile.TemporaryDirectory(dir=PROPAGATION_DIR) as work_dir:
+        with connection() as read_conn:
+            # Vectors and edges are read from the same snapshot
+            read_conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+            with metrics.timer('stage_seconds', stage='load_vectors'):
+                keys, current = load_vector_matrix(read_conn, os.path.join(work_dir, 'round_0.f32'))
+            print(f"Loaded {len(keys)} vectors")
+            if not keys:
+                return
+            
+            with metrics.timer('stage_seconds', stage='load_edges'):
+                row_of = {(node_id, label_name(node_label)): row for row, (node_id, node_label) in enumerate(keys)}
+                sources, targets = load_edge_rows(read_conn, row_of)
+                del row_of
+                indptr, indices = build_adjacency(sources, targets, len(keys))
+                del sources, targets
+            read_conn.commit()
+        isolated = int(np.count_nonzero(np.diff(indptr) == 0))
+        print(f"Loaded {len(indices) // 2} edges ({isolated} nodes without neighbours keep their vector)")
+        
+        for round_number in range(1, rounds + 1):
+            start = time.time()
+            with metrics.timer('stage_seconds', stage='propagation_round'):
+                following = np.memmap(os.path.join(work_dir, f"round_{round_number}.f32"),
+                                      dtype=np.float32, mode='w+', shape=current.shape)
+                propagate(current, indptr, indices, following, PROPAGATION_SELF_WEIGHT,
+                          PROPAGATION_BLOCK_ROWS, PROPAGATION_MAX_EDGES)
+            # Only the latest round is kept on disk
+            os.remove(current.filename)
+            current = following
+            print(f"Round {round_number} done in {time.time() - start:.1f}s")
+        
+        with connection() as conn:
+            with metrics.timer('stage_seconds', stage='write_vectors'):
+                write_graph_embeddings(conn, keys, current)
+            print(f"Stored {len(keys)} vectors in document_vectors.graph_embedding")
+            del current
+            
+            # ANN index so graph_embedding can be searched like embedding
+            with metrics.timer('stage_seconds', stage='index_build'):
+                create_graph_embedding_index(conn)
+    metrics.report()
+
+# Similarity edges: all-pairs k-NN over document_vectors stored as weighted SIMILAR_TO edges
+SIMILAR_K = int(os.getenv('SIMILAR_K', 10))
+SIMILAR_THRESHOLD = float(os.getenv('SIMILAR_THRESHOLD', 0.9))
+SIMILAR_EDGE_LABEL = os.getenv('SIMILAR_EDGE_LABEL', 'SIMILAR_TO')
+# Comma-separated labels to restrict the pairs to (all labels by default)
+SIMILAR_LABELS = [label for label in os.getenv('SIMILAR_LABELS', '').split(',') if label]
+SIMILAR_WORKERS = int(os.getenv('SIMILAR_WORKERS', os.cpu_count() or 1))
+# Query rows per task and corpus rows per matrix product
+SIMILAR_QUERY_ROWS = int(os.getenv('SIMILAR_QUERY_ROWS', 1024))
+SIMILAR_CORPUS_ROWS = int(os.getenv('SIMILAR_CORPUS_ROWS', 16384))
+
+def similar_pairs(path, shape, k, threshold):
+    """Blocked top-k over the normalized matrix at path, split across worker processes"""
+    tasks = [(start, min(start + SIMILAR_QUERY_ROWS, shape[0])) for start in range(0, shape[0], SIMILAR_QUERY_ROWS)]
+    sources, targets, scores = [], [], []
+    # Forked workers only read the memmap; spawning would re-run the calling script's top level
+    with ProcessPoolExecutor(max_workers=SIMILAR_WORKERS, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(block_top_k, path, shape, start, end, k, threshold, SIMILAR_CORPUS_ROWS)
+                   for start, end in tasks]
+        for done, future in enumerate(futures, start=1):
+            block_sources, block_targets, block_scores = future.result()
+            sources.append(block_sources)
+            targets.append(block_targets)
+            scores.append(block_scores)
+            if done % 100 == 0 or done == len(futures):
+                print(f"  {done}/{len(futures)} query blocks done")
+    return unique_pairs(np.concatenate(sources), np.concatenate(targets), np.concatenate(scores), shape[0])
+
+def ensure_edge_label(cursor, label):
+    cursor.execute("""
+        SELECT 1 FROM ag_catalog.ag_label l
+        JOIN ag_catalog.ag_graph g ON g.graphid = l.graph
+        WHERE g.name = %s AND l.name = %s
+    """, (GRAPH_NAME, label))
+    if cursor.fetchone() is None:
+        cursor.execute(f"SELECT create_elabel('{GRAPH_NAME}', '{label}');")
+        print(f"Registered '{label}' edge label")
+
+def delete_similarity_edges(conn, cursor, labels=None):
+    """Delete the similarity edges a run over labels replaces: all of them, or those between vertices of labels"""
+    if not labels:
+        cursor.execute(f'DELETE FROM {GRAPH_NAME}."{SIMILAR_EDGE_LABEL}"')
+        return
+    relations = [relation for name, relation in get_vertex_labels(conn) if name in labels]
+    if not relations:
+        return
+    vertices = " UNION ALL ".join(f"SELECT id FROM {relation}" for relation in relations)
+    cursor.execute(f"""
+        DELETE FROM {GRAPH_NAME}."{SIMILAR_EDGE_LABEL}"
+        WHERE start_id IN ({vertices}) AND end_id IN ({vertices})
+    """)
+
+def write_similarity_edges(conn, keys, sources, targets, scores, labels=None):
+    """Replace the similarity edges among the vertices of labels (all vertices by default) with the given pairs.
+
+    Edges touching other labels, e.g. from an earlier run over another
+    label set, are kept. Pairs are COPYed into a staging table by vertex
+    `id` property and label table, since ids are only unique within a
+    label, and resolved to graphids in one INSERT ... SELECT, like the
+    loader's streamed edges. Returns the number of edges inserted.
+    """
+    relation_of = {name: relation for name, relation in get_vertex_labels(conn)}
+    with conn.cursor() as cursor:
+        ensure_edge_label(cursor, SIMILAR_EDGE_LABEL)
+        delete_similarity_edges(conn, cursor, labels)
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS similar_edge_staging (
+                start_id agtype,
+                start_relation regclass,
+                end_id agtype,
+                end_relation regclass,
+                properties agtype
+            ) ON COMMIT DELETE ROWS;
+        """)
+        with cursor.copy("""
+            COPY similar_edge_staging (start_id, start_relation, end_id, end_relation, properties) FROM STDIN
+        """) as copy:
+            for source, target, score in zip(sources.tolist(), targets.tolist(), scores.tolist()):
+                (start_id, start_label), (end_id, end_label) = keys[source], keys[target]
+                start_relation = relation_of.get(label_name(start_label))
+                end_relation = relation_of.get(label_name(end_label))
+                if start_relation is None or end_relation is None:
+                    continue
+                copy.write_row((start_id, start_relation, end_id, end_relation,
+                                json.dumps({'score': round(score, 4)})))
+        cursor.execute(f"""
+            INSERT INTO {GRAPH_NAME}."{SIMILAR_EDGE_LABEL}" (start_id, end_id, properties)
+            SELECT s.id, t.id, p.properties
+            FROM similar_edge_staging p
+            JOIN {GRAPH_NAME}._ag_label_vertex s
+              ON s.tableoid = p.start_relation
+             AND ag_catalog.agtype_access_operator(VARIADIC ARRAY[s.properties, '"id"'::agtype]) = p.start_id
+            JOIN {GRAPH_NAME}._ag_label_vertex t
+              ON t.tableoid = p.end_relation
+             AND ag_catalog.agtype_access_operator(VARIADIC ARRAY[t.properties, '"id"'::agtype]) = p.end_id
+        """)
+        inserted = cursor.rowcount
+    conn.commit()
+    return inserted
+
+def build_similarity_edges(k=None, threshold=None, labels=None):
+    """Materialize each vector's nearest neighbours as weighted SIMILAR_TO edges.
+
+    document_vectors is streamed into a memory-mapped matrix, normalized,
+    and compared against itself block by block across a process pool.
+    Pairs scoring at least threshold become edges carrying their cosine
+    similarity as `score`, which links near-duplicate entities that share
+    no edge in the source data.
+    """
+    k = SIMILAR_K if k is None else k
+    threshold = SIMILAR_THRESHOLD if threshold is None else threshold
+    labels = labels or SIMILAR_LABELS or None
+    print(f"\nBuilding {SIMILAR_EDGE_LABEL} edges (k={k}, threshold={threshold}, "
+          f"labels={','.join(labels) if labels else 'all'})...")
+    metrics.serve()
+    
+    with tempfile.TemporaryDirectory(dir=PROPAGATION_DIR) as work_dir:
+        path = os.path.join(work_dir, 'vectors.f32')
+        with connection() as read_conn:
+            with metrics.timer('stage_seconds', stage='load_vectors'):
+                keys, matrix = load_vector_matrix(read_conn, path, labels)
+            read_conn.commit()
+        print(f"Loaded {len(keys)} vectors")
+        if len(keys) < 2:
+            return
+        
+        start = time.time()
+        with metrics.timer('stage_seconds', stage='similarity_search'):
+            normalize_matrix(matrix, PROPAGATION_BLOCK_ROWS)
+            matrix.flush()
+            sources, targets, scores = similar_pairs(path, matrix.shape, k, threshold)
+        del matrix
+        print(f"Found {len(sources)} pairs at or above {threshold} in {time.time() - start:.1f}s")
+    
+    with connection() as conn, metrics.timer('stage_seconds', stage='write_edges'):
+        inserted = write_similarity_edges(conn, keys, sources, targets, scores, labels)
+    metrics.inc('similarity_edges', inserted)
+    print(f"Stored {inserted} {SIMILAR_EDGE_LABEL} edges")
+    metrics.report()
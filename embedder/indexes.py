@@ -0,0 +1,338 @@
+import time
+from embedder.config import (metrics, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, STORAGE_PROFILE, VECTOR_COMPACT,
+                             DISTANCE_OPCLASSES, VECTOR_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS, INDEX_MAINTENANCE_WORK_MEM,
+                             INDEX_PARALLEL_WORKERS, vector_distance)
+from embedder.db import connection, get_vertex_labels
+from embedder.retrieval import label_filter_values, partition_table, label_partitions
+
+def vector_index_name(index_type, table='document_vectors'):
+    if VECTOR_COMPACT:
+        return f"{table}_embedding_{VECTOR_COMPACT}_{index_type}_idx"
+    return f"{table}_embedding_{index_type}_idx"
+
+def vector_index_target():
+    """(expression, opclass) indexed for the configured storage profile"""
+    distance = vector_distance()
+    if VECTOR_COMPACT == 'halfvec':
+        return f"(embedding::halfvec({EMBEDDING_DIMENSIONS}))", DISTANCE_OPCLASSES[distance].replace('vector_', 'halfvec_')
+    if VECTOR_COMPACT == 'bit':
+        return f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS}))", "bit_hamming_ops"
+    return "embedding", DISTANCE_OPCLASSES[distance]
+
+def vector_column_dimensions(cursor, table):
+    """Dimensions of table.embedding, or None when the table is missing or the column is untyped"""
+    cursor.execute("""
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = 'embedding' AND NOT attisdropped
+    """, (table,))
+    row = cursor.fetchone()
+    return row[0] if row and row[0] > 0 else None
+
+def check_vector_dimensions(cursor, table='document_vectors'):
+    """Stop before embedding when an existing table was created for other dimensions.
+
+    CREATE TABLE IF NOT EXISTS keeps the column of an earlier run, so a
+    changed model or storage profile would otherwise fail on the first write.
+    """
+    dimensions = vector_column_dimensions(cursor, table)
+    if dimensions is not None and dimensions != EMBEDDING_DIMENSIONS:
+        raise ValueError(f"{table}.embedding is vector({dimensions}) but {EMBEDDING_MODEL} with "
+                         f"STORAGE_PROFILE={STORAGE_PROFILE} produces vector({EMBEDDING_DIMENSIONS}); "
+                         f"drop or rename {table} to embed with these settings")
+
+def vectors_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_vectors')")
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+def vector_key(cursor):
+    """Primary key columns of document_vectors; a partitioned table's key includes node_label"""
+    return "id, node_label" if vectors_partitioned(cursor) else "id"
+
+def create_partitioned_vectors(cursor, vertex_labels):
+    """Create document_vectors LIST-partitioned by node_label, with a partition per vertex label.
+
+    Partitions accept both the stored '["Label"]' form and the bare label.
+    Labels registered later get their partition on the next run; rows of
+    any other label go to the default partition, and are moved into the
+    label's partition once it is created.
+    """
+    cursor.execute("SELECT to_regclass('document_vectors') IS NOT NULL")
+    if cursor.fetchone()[0] and not vectors_partitioned(cursor):
+        print("document_vectors exists and is not partitioned; run `python node_embedder.py partition` to convert it")
+        return
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS document_vectors (
+            id TEXT,
+            node_name TEXT,
+            node_label TEXT,
+            content_hash TEXT,
+            embedding vector({EMBEDDING_DIMENSIONS}),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, node_label)
+        ) PARTITION BY LIST (node_label);
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS document_vectors_default PARTITION OF document_vectors DEFAULT;")
+    existing = label_partitions(cursor)
+    for label_name, _ in vertex_labels:
+        if partition_table(label_name) in existing:
+            continue
+        values = ', '.join(f"'{value}'" for value in label_filter_values([label_name]))
+        # Rows stored before the label had a partition sit in the default partition, whose
+        # constraint would reject the new partition: take them out, then re-insert them through the parent
+        cursor.execute(f"""
+            CREATE TEMP TABLE default_label_rows AS
+            SELECT * FROM document_vectors_default WHERE node_label IN ({values})
+        """)
+        cursor.execute(f"DELETE FROM document_vectors_default WHERE node_label IN ({values})")
+        cursor.execute(f"""
+            CREATE TABLE {partition_table(label_name)}
+            PARTITION OF document_vectors FOR VALUES IN ({values});
+        """)
+        cursor.execute("INSERT INTO document_vectors SELECT * FROM default_label_rows")
+        if cursor.rowcount:
+            print(f"Moved {cursor.rowcount} {label_name} vectors from the default partition")
+        cursor.execute("DROP TABLE default_label_rows")
+
+def migrate_to_partitions():
+    """Convert an unpartitioned document_vectors into the label-partitioned layout in one transaction"""
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            if vectors_partitioned(cursor):
+                print("document_vectors is already partitioned by label")
+                return
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'document_vectors' AND column_name = 'graph_embedding'
+            """)
+            has_graph_embedding = cursor.fetchone() is not None
+            previous_indexes = get_vector_indexes(conn)
+
+            start = time.time()
+            print("Converting document_vectors to label partitions...")
+            cursor.execute("ALTER TABLE document_vectors RENAME TO document_vectors_unpartitioned")
+            cursor.execute("ALTER INDEX IF EXISTS document_vectors_pkey RENAME TO document_vectors_unpartitioned_pkey")
+            create_partitioned_vectors(cursor, get_vertex_labels(conn))
+            columns = "id, node_name, node_label, content_hash, embedding, created_at"
+            if has_graph_embedding:
+                cursor.execute(f"ALTER TABLE document_vectors ADD COLUMN graph_embedding vector({EMBEDDING_DIMENSIONS});")
+                columns += ", graph_embedding"
+            cursor.execute(f"INSERT INTO document_vectors ({columns}) SELECT {columns} FROM document_vectors_unpartitioned")
+            moved = cursor.rowcount
+            cursor.execute("DROP TABLE document_vectors_unpartitioned")
+            conn.commit()
+            print(f"Moved {moved} vectors into {len(label_partitions(cursor))} partitions in {time.time() - start:.1f}s")
+
+        # Each partition gets its own ANN index, of the type the table had before
+        index_type = previous_indexes[0][1] if previous_indexes else VECTOR_INDEX_TYPE
+        with metrics.timer('stage_seconds', stage='index_build'):
+            create_vector_index(conn, index_type)
+        if has_graph_embedding:
+            create_graph_embedding_index(conn)
+
+def create_graph_embedding_index(conn):
+    """HNSW index so graph_embedding can be searched like embedding"""
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+            cursor.execute(f"SET max_parallel_maintenance_workers = {INDEX_PARALLEL_WORKERS}")
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS document_vectors_graph_embedding_hnsw_idx
+                ON document_vectors USING hnsw (graph_embedding {DISTANCE_OPCLASSES[vector_distance()]})
+                WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+            """)
+            cursor.execute("RESET maintenance_work_mem")
+            cursor.execute("RESET max_parallel_maintenance_workers")
+    finally:
+        conn.autocommit = False
+
+def vector_index_tables(cursor, label=None):
+    """Tables carrying the ANN indexes: every partition when partitioned, else document_vectors itself"""
+    partitions = label_partitions(cursor)
+    if label:
+        if partition_table(label) not in partitions:
+            raise ValueError(f"No document_vectors partition for label '{label}'")
+        return [partition_table(label)]
+    return sorted(partitions) or ['document_vectors']
+
+def get_vector_indexes(conn, tables=None):
+    """Return (name, method) for every ANN index on the embedding column of the given tables"""
+    with conn.cursor() as cursor:
+        tables = tables or vector_index_tables(cursor)
+        cursor.execute("""
+            SELECT i.relname, am.amname
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_am am ON am.oid = i.relam
+            WHERE x.indrelid = ANY(%s::regclass[])
+            AND am.amname IN ('hnsw', 'ivfflat')
+            AND i.relname NOT LIKE '%%graph_embedding%%'
+        """, (tables,))
+        return cursor.fetchall()
+
+def indexed_search_modes(conn, compacts):
+    """The compact search modes (None for full precision) with a matching ANN index on every table.
+
+    An index matches when it was built on the expression knn_search orders by,
+    at the configured dimensions and distance; other modes would fall back to
+    sequential scans.
+    """
+    opclass = DISTANCE_OPCLASSES[vector_distance()]
+    needles = {
+        None: f"(embedding {opclass})",
+        'halfvec': f"::halfvec({EMBEDDING_DIMENSIONS})) {opclass.replace('vector_', 'halfvec_')}",
+        'bit': f"::bit({EMBEDDING_DIMENSIONS})) bit_hamming_ops",
+    }
+    with conn.cursor() as cursor:
+        tables = vector_index_tables(cursor)
+        cursor.execute("""
+            SELECT c.relname, pg_get_indexdef(x.indexrelid)
+            FROM pg_index x
+            JOIN pg_class c ON c.oid = x.indrelid
+            WHERE x.indrelid = ANY(%s::regclass[])
+        """, (tables,))
+        definitions = cursor.fetchall()
+    return {compact for compact in compacts
+            if all(any(table == relname and needles[compact] in definition for relname, definition in definitions)
+                   for table in tables)}
+
+def ivfflat_lists(cursor, table='document_vectors'):
+    """Number of IVFFlat lists: rows / 1000 up to 1M rows, sqrt(rows) above"""
+    if IVFFLAT_LISTS > 0:
+        return IVFFLAT_LISTS
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    rows = cursor.fetchone()[0]
+    if rows <= 1000000:
+        return max(1, rows // 1000)
+    return int(rows ** 0.5)
+
+def create_vector_index(conn, index_type=None, concurrently=False, tables=None):
+    """Build the ANN index on the embedding column of each table with tuned maintenance settings.
+
+    A partitioned document_vectors gets one index per partition, so every
+    label is searched through its own smaller graph.
+    """
+    index_type = index_type or VECTOR_INDEX_TYPE
+    if index_type not in ('hnsw', 'ivfflat'):
+        raise ValueError(f"Unknown vector index type '{index_type}' (expected hnsw or ivfflat)")
+    expression, opclass = vector_index_target()
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        tables = tables or vector_index_tables(cursor)
+        try:
+            cursor.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+            cursor.execute(f"SET max_parallel_maintenance_workers = {INDEX_PARALLEL_WORKERS}")
+            for table in tables:
+                if index_type == 'hnsw':
+                    options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+                else:
+                    options = f"lists = {ivfflat_lists(cursor, table)}"
+                print(f"Building {index_type} index on {table} ({options}, {opclass})...")
+                start = time.time()
+                cursor.execute(f"""
+                    CREATE INDEX {'CONCURRENTLY' if concurrently else ''} IF NOT EXISTS {vector_index_name(index_type, table)}
+                    ON {table} USING {index_type} ({expression} {opclass})
+                    WITH ({options})
+                """)
+                print(f"Index built in {time.time() - start:.1f}s")
+        finally:
+            cursor.execute("RESET maintenance_work_mem")
+            cursor.execute("RESET max_parallel_maintenance_workers")
+            conn.autocommit = False
+
+def ensure_vector_indexes(conn):
+    """Build the ANN index of every table (every partition when partitioned) that has none"""
+    with conn.cursor() as cursor:
+        tables = vector_index_tables(cursor)
+    unindexed = [table for table in tables if not get_vector_indexes(conn, [table])]
+    if unindexed:
+        with metrics.timer('stage_seconds', stage='index_build'):
+            create_vector_index(conn, tables=unindexed)
+
+def drop_vector_indexes(conn):
+    """Drop every ANN index so bulk loads don't pay for index inserts on each row"""
+    with conn.cursor() as cursor:
+        for index_name, index_type in get_vector_indexes(conn):
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            print(f"Dropped {index_type} index {index_name} for bulk load")
+    conn.commit()
+
+def rebuild_vector_index(index_type=None, label=None):
+    """Rebuild the ANN indexes online, switching type if a different one is requested.
+
+    With a partitioned document_vectors, label limits the rebuild to that
+    label's partition.
+    """
+    index_type = index_type or VECTOR_INDEX_TYPE
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            tables = vector_index_tables(cursor, label)
+        for table in tables:
+            existing = get_vector_indexes(conn, [table])
+            conn.commit()
+            if any(name == vector_index_name(index_type, table) for name, _ in existing):
+                # Same index: rebuild it without blocking searches
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    try:
+                        cursor.execute(f"SET maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+                        cursor.execute(f"SET max_parallel_maintenance_workers = {INDEX_PARALLEL_WORKERS}")
+                        print(f"Rebuilding {vector_index_name(index_type, table)}...")
+                        start = time.time()
+                        cursor.execute(f"REINDEX INDEX CONCURRENTLY {vector_index_name(index_type, table)}")
+                        print(f"Index rebuilt in {time.time() - start:.1f}s")
+                    finally:
+                        cursor.execute("RESET maintenance_work_mem")
+                        cursor.execute("RESET max_parallel_maintenance_workers")
+                        conn.autocommit = False
+            else:
+                # New index type: build it first, then drop the old ones
+                create_vector_index(conn, index_type, concurrently=True, tables=[table])
+                with conn.cursor() as cursor:
+                    for index_name, _ in existing:
+                        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+                        print(f"Dropped previous index {index_name}")
+                conn.commit()
+
+def check_index_status():
+    """Report ANN index sizes and the progress of any running index build"""
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            tables = vector_index_tables(cursor)
+        indexes = get_vector_indexes(conn, tables)
+        with conn.cursor() as cursor:
+            if not indexes:
+                print("No vector index on document_vectors.")
+            for index_name, index_type in indexes:
+                cursor.execute("""
+                    SELECT pg_size_pretty(pg_relation_size(%s::regclass)),
+                           pg_size_pretty(pg_relation_size(x.indrelid)), x.indrelid::regclass::text
+                    FROM pg_index x WHERE x.indexrelid = %s::regclass
+                """, (index_name, index_name))
+                index_size, table_size, table = cursor.fetchone()
+                print(f"Index: {index_name} ({index_type})")
+                print(f"  Size: {index_size} ({table}: {table_size})")
+
+            cursor.execute("""
+                SELECT p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total,
+                       now() - a.query_start
+                FROM pg_stat_progress_create_index p
+                JOIN pg_stat_activity a ON a.pid = p.pid
+                WHERE p.relid = ANY(%s::regclass[])
+            """, (tables,))
+            builds = cursor.fetchall()
+    for phase, blocks_done, blocks_total, tuples_done, tuples_total, elapsed in builds:
+        print("Index build in progress:")
+        print(f"  Phase: {phase}")
+        if blocks_total:
+            print(f"  Blocks: {blocks_done}/{blocks_total} ({blocks_done / blocks_total * 100:.1f}%)")
+        if tuples_total:
+            print(f"  Tuples: {tuples_done}/{tuples_total} ({tuples_done / tuples_total * 100:.1f}%)")
+        print(f"  Elapsed: {elapsed}")
+    if not builds:
+        print("No index build in progress.")
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serve metrics on this port when set, and write the run summary to this path when set
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+RUN_SUMMARY = os.environ.get("RUN_SUMMARY")
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{str(value)}"' for name, value in pairs) + '}'
+
+class Metrics:
+    """Thread-safe counters and histograms for one script.
+
+    Metrics are rendered in the OpenMetrics text format, served over HTTP
+    when METRICS_PORT is set, and summarized as JSON at the end of a run.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            key = label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration in a histogram"""
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            key = label_key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block into a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """All metrics in the OpenMetrics text exposition format"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{metric}_total{format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                lines.append(f"# UNIT {metric} seconds")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(BUCKETS, histogram['buckets']):
+                        lines.append(f"{metric}_bucket{format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{metric}_bucket{format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{metric}_count{format_labels(key)} {histogram['count']}")
+                    lines.append(f"{metric}_sum{format_labels(key)} {histogram['sum']}")
+        lines.append("# EOF")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Machine-readable run summary: counters, and count/total/mean/max seconds per histogram"""
+        def series_name(name, key):
+            return name + ''.join(f"[{value}]" for _, value in key)
+
+        with self.lock:
+            return {
+                'namespace': self.namespace,
+                'elapsed_seconds': time.time() - self.started,
+                'counters': {
+                    series_name(name, key): value
+                    for name, series in sorted(self.counters.items())
+                    for key, value in sorted(series.items())
+                },
+                'timings': {
+                    series_name(name, key): {
+                        'count': histogram['count'],
+                        'total_seconds': histogram['sum'],
+                        'mean_seconds': histogram['sum'] / histogram['count'],
+                        'max_seconds': histogram['max'],
+                    }
+                    for name, series in sorted(self.histograms.items())
+                    for key, histogram in sorted(series.items())
+                },
+            }
+
+    def report(self, path=None):
+        """Print the run summary and write it as JSON to path (RUN_SUMMARY by default)"""
+        summary = self.summary()
+        print(f"\nRun summary ({summary['elapsed_seconds']:.1f}s):")
+        for name, value in summary['counters'].items():
+            print(f"  {name}: {value}")
+        for name, timing in summary['timings'].items():
+            print(f"  {name}: {timing['count']} x {timing['mean_seconds'] * 1000:.1f} ms "
+                  f"= {timing['total_seconds']:.1f}s (max {timing['max_seconds'] * 1000:.0f} ms)")
+        path = path or RUN_SUMMARY
+        if path:
+            with open(path, 'w') as summary_file:
+                json.dump(summary, summary_file, indent=2)
+            print(f"Run summary written to {path}")
+        return summary
+
+    def serve(self, port=None):
+        """Expose /metrics on port (METRICS_PORT by default) from a background thread"""
+        port = port or METRICS_PORT
+        if not port:
+            return None
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                payload = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://0.0.0.0:{port}/metrics")
+        return server
@@ -0,0 +1,641 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg
+from embedder.config import (metrics, EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_MAX_INPUTS,
+                             EMBEDDING_MAX_TOKENS, EMBEDDING_CONCURRENCY, EMBEDDING_RPM, EMBEDDING_TPM,
+                             VECTOR_PARTITIONING, BULK_INDEX_THRESHOLD, create_embedding_backend)
+from embedder.db import connection, get_vertex_labels, register_vector
+from embedder.embedding import (RateLimiter, node_text, content_hash, pack_embedding_batches, embed_unique)
+from embedder.indexes import (vector_key, vectors_partitioned, vector_column_dimensions, check_vector_dimensions,
+                              create_partitioned_vectors, drop_vector_indexes, ensure_vector_indexes)
+from embedder.sessions import (create_session_counters, session_counts, count_pending_nodes, mark_session_initialized,
+                               reset_failed_nodes)
+
+def find_unchanged_nodes(cursor, nodes):
+    """Return ids of nodes already stored in document_vectors with the same input text"""
+    hashes = {str(node_id): content_hash(node_text(node_label, node_name))
+              for node_id, node_name, node_label in nodes}
+    cursor.execute("""
+        SELECT id, content_hash, node_name, node_label
+        FROM document_vectors WHERE id = ANY(%s)
+    """, (list(hashes),))
+    unchanged = set()
+    for node_id, stored_hash, node_name, node_label in cursor.fetchall():
+        # Rows written before content hashes were stored are compared by text
+        stored_hash = stored_hash or content_hash(node_text(node_label, node_name))
+        if stored_hash == hashes[node_id]:
+            unchanged.add(node_id)
+    return unchanged
+
+def prepare_embedding_batch(cursor, batch):
+    """Split a packed batch into (to_embed, cached, empty, existing).
+
+    Nodes already embedded with the same text are `existing`, nodes whose
+    text is in embedding_cache come back as `cached` (node, embedding) pairs,
+    and only the rest need an API call.
+    """
+    start = time.perf_counter()
+
+    # Skip nodes with an empty name
+    empty = [node for node in batch if not node[1] or node[1].strip() == '']
+    batch = [node for node in batch if node[1] and node[1].strip() != '']
+
+    # Check which nodes are already embedded (in case of duplicate processing)
+    existing = find_unchanged_nodes(cursor, batch)
+    batch = [node for node in batch if str(node[0]) not in existing]
+
+    # Reuse cached vectors for texts embedded before
+    hashes = [content_hash(node_text(node_label, node_name)) for _, node_name, node_label in batch]
+    cursor.execute("""
+        SELECT content_hash, embedding FROM embedding_cache WHERE content_hash = ANY(%s)
+    """, (list(set(hashes)),))
+    cache = dict(cursor.fetchall())
+    cached = [(node, cache[h]) for node, h in zip(batch, hashes) if h in cache]
+    to_embed = [node for node, h in zip(batch, hashes) if h not in cache]
+
+    metrics.observe('stage_seconds', time.perf_counter() - start, stage='cache_lookup')
+    metrics.inc('nodes_cached', len(cached))
+    metrics.inc('nodes_unchanged', len(existing))
+    return to_embed, cached, empty, existing
+
+def write_embedding_results(write_cursor, session_id, embedded, failed, existing, empty):
+    """Write vectors and per-node progress for one batch. Returns the number of nodes completed.
+
+    Vectors are streamed with binary COPY into a temporary staging table and
+    merged into document_vectors with one statement; progress rows are then
+    updated with one set-based statement per status.
+    """
+    if embedded:
+        # Staging table lives for the connection, rows are cleared on commit
+        write_cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS document_vectors_staging (
+                id TEXT,
+                node_name TEXT,
+                node_label TEXT,
+                content_hash TEXT,
+                embedding vector({EMBEDDING_DIMENSIONS})
+            ) ON COMMIT DELETE ROWS;
+        """)
+        with write_cursor.copy("""
+            COPY document_vectors_staging (id, node_name, node_label, content_hash, embedding)
+            FROM STDIN WITH (FORMAT BINARY)
+        """) as copy:
+            copy.set_types(['text', 'text', 'text', 'text', 'vector'])
+            for (node_id, node_name, node_label), embedding in embedded:
+                copy.write_row((str(node_id), str(node_name), str(node_label),
+                                content_hash(node_text(node_label, node_name)), embedding))
+
+        # Merge staged vectors into document_vectors table
+        write_cursor.execute(f"""
+            INSERT INTO document_vectors (id, node_name, node_label, content_hash, embedding)
+            SELECT DISTINCT ON (id) id, node_name, node_label, content_hash, embedding
+            FROM document_vectors_staging
+            ON CONFLICT ({vector_key(write_cursor)}) DO UPDATE SET
+                node_name = EXCLUDED.node_name,
+                node_label = EXCLUDED.node_label,
+                content_hash = EXCLUDED.content_hash,
+                embedding = EXCLUDED.embedding
+        """)
+
+        # Remember new texts so identical inputs are never embedded twice
+        write_cursor.execute("""
+            INSERT INTO embedding_cache (content_hash, model, dimensions, embedding)
+            SELECT DISTINCT ON (content_hash) content_hash, %s, %s, embedding
+            FROM document_vectors_staging
+            ON CONFLICT (content_hash) DO NOTHING
+        """, (EMBEDDING_MODEL, EMBEDDING_DIMENSIONS))
+
+    # Mark embedded and already existing nodes as completed in progress table
+    completed = list(existing) + [str(node_id) for (node_id, _, _), _ in embedded]
+    if completed:
+        write_cursor.execute("""
+            UPDATE embedding_progress
+            SET status = 'completed', updated_at = CURRENT_TIMESTAMP
+            WHERE session_id = %s AND node_id = ANY(%s)
+        """, (session_id, completed))
+
+    # Mark failed nodes with their own error message
+    for (node_id, node_name, _), error_msg in failed:
+        print(f"Error embedding node {node_id} ({node_name}): {error_msg}")
+    failed = failed + [(node, 'Empty node name') for node in empty]
+    metrics.inc('nodes_failed', len(failed))
+    if failed:
+        write_cursor.execute("""
+            UPDATE embedding_progress ep
+            SET status = 'failed', error_message = f.error_message, updated_at = CURRENT_TIMESTAMP
+            FROM unnest(%s::text[], %s::text[]) AS f(node_id, error_message)
+            WHERE ep.session_id = %s AND ep.node_id = f.node_id
+        """, ([str(node_id) for (node_id, _, _), _ in failed],
+              [error_msg for _, error_msg in failed],
+              session_id))
+
+    return len(completed)
+
+def process_embedding_batch(conn, backend, session_id, batch):
+    """Embed one packed batch and record per-node progress. Returns the number of nodes completed"""
+    with conn.cursor() as cursor:
+        to_embed, cached, empty, existing = prepare_embedding_batch(cursor, batch)
+        if cached:
+            print(f"  Reused {len(cached)} cached embeddings")
+        embedded, failed = embed_unique(backend, to_embed)
+        metrics.inc('nodes_embedded', len(embedded))
+        with metrics.timer('stage_seconds', stage='db_write'):
+            return write_embedding_results(cursor, session_id, embedded + cached, failed, existing, empty)
+
+def write_results_worker(session_id, results, stats):
+    """Writer stage: drain finished batches to Postgres on a connection of its own.
+
+    An error that stops the writer itself, rather than one batch, is kept in
+    stats['error'] for run_concurrent_pipeline to re-raise.
+    """
+    try:
+        with connection() as writer_conn:
+            with writer_conn.cursor() as writer_cursor:
+                while True:
+                    item = results.get()
+                    if item is None:
+                        break
+                    try:
+                        with metrics.timer('stage_seconds', stage='db_write'):
+                            completed = write_embedding_results(writer_cursor, session_id, *item)
+                        with metrics.timer('stage_seconds', stage='commit'):
+                            writer_conn.commit()
+                        metrics.inc('nodes_completed', completed)
+                        stats['completed'] += completed
+                        stats['batches'] += 1
+                        print(f"  Committed batch {stats['batches']}: {stats['completed']} embedded in this session")
+                    except psycopg.OperationalError:
+                        # The connection is gone, so every later batch would fail too
+                        raise
+                    except Exception as e:
+                        print(f"Error writing batch: {str(e)}")
+                        writer_conn.rollback()
+    except BaseException as e:
+        stats['error'] = e
+
+def run_concurrent_pipeline(conn, backend, session_id, batches):
+    """Keep EMBEDDING_CONCURRENCY requests in flight while a writer thread stores the results.
+
+    Requests share a RateLimiter so throughput rises to the account's RPM/TPM
+    ceiling and backs off on 429s. Returns the number of nodes completed.
+    """
+    limiter = RateLimiter(EMBEDDING_RPM, EMBEDDING_TPM) if backend.rate_limited else None
+    results = queue.Queue(maxsize=EMBEDDING_CONCURRENCY * 2)
+    stats = {'completed': 0, 'batches': 0}
+    writer = threading.Thread(target=write_results_worker, args=(session_id, results, stats))
+    writer.start()
+
+    in_flight = threading.BoundedSemaphore(EMBEDDING_CONCURRENCY)
+
+    def queue_result(item):
+        """Hand an item to the writer, giving up once the writer has stopped"""
+        while writer.is_alive():
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def embed_and_queue(to_embed, cached, empty, existing):
+        try:
+            embedded, failed = embed_unique(backend, to_embed, limiter)
+            metrics.inc('nodes_embedded', len(embedded))
+        except Exception as e:
+            embedded, failed = [], [(node, str(e)) for node in to_embed]
+        finally:
+            in_flight.release()
+        queue_result((embedded + cached, failed, existing, empty))
+
+    try:
+        with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as executor, conn.cursor() as cursor:
+            for batch in batches:
+                # Stop claiming work once nothing can be stored
+                if not writer.is_alive():
+                    break
+                to_embed, cached, empty, existing = prepare_embedding_batch(cursor, batch)
+                # Don't hold the read transaction open while waiting on the API
+                conn.commit()
+                in_flight.acquire()
+                executor.submit(embed_and_queue, to_embed, cached, empty, existing)
+    finally:
+        queue_result(None)
+        writer.join()
+    if 'error' in stats:
+        raise RuntimeError(f"Result writer stopped: {stats['error']}") from stats['error']
+    return stats['completed']
+
+def embed_pending_nodes(conn, backend, session_id, nodes_to_process, remaining):
+    """Embed a stream of (node_id, node_name, node_label) nodes. Returns the number of nodes completed"""
+    embedded_count = 0
+
+    # Get current progress
+    counts = session_counts(conn, session_id)
+    already_completed = counts[2] if counts else 0
+
+    print(f"Already completed: {already_completed}")
+    print(f"Remaining to process: {remaining}")
+    print(f"Batching up to {EMBEDDING_MAX_INPUTS} inputs / {EMBEDDING_MAX_TOKENS} tokens per request")
+
+    # Pack nodes into requests by input count and token budget
+    if EMBEDDING_CONCURRENCY > 1:
+        print(f"Running {EMBEDDING_CONCURRENCY} concurrent requests (limits: {EMBEDDING_RPM} RPM, {EMBEDDING_TPM} TPM)")
+        embedded_count = run_concurrent_pipeline(conn, backend, session_id, pack_embedding_batches(nodes_to_process))
+    else:
+        for batch_number, batch in enumerate(pack_embedding_batches(nodes_to_process), start=1):
+            print(f"Processing batch {batch_number} ({len(batch)} nodes)...")
+
+            try:
+                completed = process_embedding_batch(conn, backend, session_id, batch)
+            except Exception as e:
+                print(f"Error processing batch {batch_number}: {str(e)}")
+                conn.rollback()
+                continue
+
+            # Commit batch
+            try:
+                with metrics.timer('stage_seconds', stage='commit'):
+                    conn.commit()
+                embedded_count += completed
+                metrics.inc('nodes_completed', completed)
+                total_completed = already_completed + embedded_count
+                print(f"  Committed batch {batch_number}: {embedded_count} embedded in this session ({total_completed} total completed)")
+            except Exception as e:
+                print(f"Error committing batch: {str(e)}")
+                conn.rollback()
+
+    return embedded_count
+
+def init_session_progress(conn, session_id, vertex_labels, incremental=False):
+    """Track the named vertices of every label for a session, one INSERT ... SELECT per label.
+
+    Ids and names are read straight from the AGE label tables in the same
+    agtype text form the Cypher queries return, and empty names are
+    filtered out in SQL. In incremental mode nodes whose stored content hash
+    matches their current text are skipped. The session is marked initialized
+    once every label is tracked. Returns the number of rows tracked.
+    """
+    hash_prefix = f"{EMBEDDING_MODEL}\n{EMBEDDING_DIMENSIONS}\n"
+    # Rows written before content hashes were stored are compared by text
+    changed_filter = """
+        AND NOT EXISTS (
+            SELECT 1 FROM document_vectors dv
+            WHERE dv.id = v.node_id
+            AND COALESCE(dv.content_hash, encode(sha256(convert_to(
+                    %(hash_prefix)s || dv.node_label || ': ' || dv.node_name, 'UTF8')), 'hex'))
+                = encode(sha256(convert_to(
+                    %(hash_prefix)s || v.node_label || ': ' || v.node_name, 'UTF8')), 'hex')
+        )
+    """ if incremental else ""
+
+    tracked = 0
+    complete = True
+    with conn.cursor() as cursor:
+        for label_name, table_relation in vertex_labels:
+            try:
+                start = time.perf_counter()
+                # Also fills in names for rows tracked before node_name was stored
+                cursor.execute(f"""
+                    INSERT INTO embedding_progress (session_id, node_id, node_name, node_label, status)
+                    SELECT %(session_id)s, v.node_id, v.node_name, v.node_label, 'pending'
+                    FROM (
+                        SELECT ag_catalog.agtype_out(ag_catalog.agtype_access_operator(
+                                   VARIADIC ARRAY[properties, '"id"'::agtype]))::text AS node_id,
+                               ag_catalog.agtype_out(ag_catalog.agtype_access_operator(
+                                   VARIADIC ARRAY[properties, '"name"'::agtype]))::text AS node_name,
+                               %(node_label)s AS node_label
+                        FROM {table_relation}
+                    ) v
+                    WHERE v.node_id IS NOT NULL
+                    AND v.node_name IS NOT NULL AND v.node_name <> 'null'
+                    AND btrim(v.node_name, ' "') <> ''
+                    {changed_filter}
+                    ON CONFLICT (session_id, node_id) DO UPDATE SET node_name = EXCLUDED.node_name
+                    WHERE embedding_progress.node_name IS NULL
+                """, {
+                    'session_id': session_id,
+                    'node_label': json.dumps([label_name]),
+                    'hash_prefix': hash_prefix,
+                })
+                conn.commit()
+                metrics.observe('stage_seconds', time.perf_counter() - start, stage='session_init')
+                print(f"Tracked {cursor.rowcount} nodes from {label_name}")
+                tracked += cursor.rowcount
+            except psycopg.Error as e:
+                print(f"Error tracking {label_name} nodes: {str(e)}")
+                conn.rollback()
+                complete = False
+    # A label that failed is tracked again on the next resume
+    if complete:
+        mark_session_initialized(conn, session_id)
+    return tracked
+
+# Work queue settings for sharing a session between several workers
+WORKER_ID = os.getenv('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+LEASE_SECONDS = int(os.getenv('LEASE_SECONDS', 300))
+CLAIM_SIZE = int(os.getenv('CLAIM_SIZE', 1000))
+
+def claim_nodes(conn, session_id):
+    """Yield (node_id, node_name, node_label) for nodes claimed from embedding_progress.
+
+    Nodes are claimed CLAIM_SIZE at a time with FOR UPDATE SKIP LOCKED and
+    leased to this worker for LEASE_SECONDS, so concurrent workers never get
+    the same node. Leases left behind by crashed workers expire and are
+    claimed again.
+    """
+    while True:
+        start = time.perf_counter()
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE embedding_progress
+                SET worker_id = %s,
+                    lease_expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM embedding_progress
+                    WHERE session_id = %s AND status = 'pending'
+                    AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING node_id, node_name, node_label
+            """, (WORKER_ID, LEASE_SECONDS, session_id, CLAIM_SIZE))
+            claimed = cursor.fetchall()
+        # Commit so other workers see the lease right away
+        conn.commit()
+        metrics.observe('stage_seconds', time.perf_counter() - start, stage='claim')
+        metrics.inc('nodes_claimed', len(claimed))
+        if not claimed:
+            return
+        yield from claimed
+
+def renew_leases(session_id, stop):
+    """Heartbeat: extend the leases of every node this worker holds until stop is set"""
+    with connection() as renew_conn:
+        while not stop.wait(LEASE_SECONDS / 3):
+            with renew_conn.cursor() as renew_cursor:
+                renew_cursor.execute("""
+                    UPDATE embedding_progress
+                    SET lease_expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                    WHERE session_id = %s AND worker_id = %s AND status = 'pending'
+                """, (LEASE_SECONDS, session_id, WORKER_ID))
+            renew_conn.commit()
+
+def process_session(conn, backend, session_id, remaining):
+    """Embed claimed nodes of a session until none are left, renewing leases meanwhile"""
+    print(f"Worker {WORKER_ID} claiming {CLAIM_SIZE} nodes at a time (lease {LEASE_SECONDS}s)")
+    stop = threading.Event()
+    renewer = threading.Thread(target=renew_leases, args=(session_id, stop), daemon=True)
+    renewer.start()
+    try:
+        return embed_pending_nodes(conn, backend, session_id, claim_nodes(conn, session_id), remaining)
+    finally:
+        stop.set()
+        renewer.join()
+
+def run_worker(session_id=None):
+    """Join an existing session as an extra worker"""
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            if session_id is None:
+                cursor.execute("""
+                    SELECT session_id FROM embedding_sessions
+                    WHERE pending > 0
+                    ORDER BY started_at DESC
+                    LIMIT 1
+                """)
+                row = cursor.fetchone()
+                if row is None:
+                    print("No session with pending nodes found.")
+                    return
+                session_id = row[0]
+
+            cursor.execute("""
+                SELECT COUNT(*) FROM embedding_progress
+                WHERE session_id = %s AND status = 'pending' AND node_name IS NULL
+            """, (session_id,))
+            if cursor.fetchone()[0]:
+                print(f"Session {session_id} was started before node names were tracked; "
+                      "resume it once with `python node_embedder.py` before adding workers.")
+                return
+            check_vector_dimensions(cursor)
+
+        backend = create_embedding_backend(concurrent=True)
+        metrics.serve()
+        try:
+            print(f"Joining session {session_id}")
+            process_session(conn, backend, session_id, count_pending_nodes(conn, session_id))
+        finally:
+            backend.close()
+    metrics.report()
+
+def create_embedding_tables(conn):
+    """document_vectors, embedding_cache, embedding_progress and embedding_sessions"""
+    with conn.cursor() as cursor:
+        # Main embeddings table; a partitioned one gets partitions for new labels even without the flag
+        if VECTOR_PARTITIONING or vectors_partitioned(cursor):
+            create_partitioned_vectors(cursor, get_vertex_labels(conn))
+        query = f"""
+            CREATE TABLE IF NOT EXISTS document_vectors (
+                id TEXT PRIMARY KEY,
+                node_name TEXT,
+                node_label TEXT,
+                content_hash TEXT,
+                embedding vector({EMBEDDING_DIMENSIONS}),  -- model dimensionality, or shortened by the storage profile
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        cursor.execute(query)
+        cursor.execute("ALTER TABLE document_vectors ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+        check_vector_dimensions(cursor)
+
+        # Embeddings keyed by hash of model, dimensions and input text; untyped so several profiles share it
+        cache_query = """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                content_hash TEXT PRIMARY KEY,
+                model TEXT,
+                dimensions INTEGER,
+                embedding vector,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        cursor.execute(cache_query)
+        if vector_column_dimensions(cursor, 'embedding_cache') is not None:
+            cursor.execute("ALTER TABLE embedding_cache ALTER COLUMN embedding TYPE vector")
+
+        # Progress tracking table
+        progress_query = """
+            CREATE TABLE IF NOT EXISTS embedding_progress (
+                id SERIAL PRIMARY KEY,
+                session_id TEXT,
+                node_id TEXT,
+                node_label TEXT,
+                status TEXT CHECK (status IN ('pending', 'completed', 'failed')),
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(session_id, node_id)
+            );
+        """
+        cursor.execute(progress_query)
+
+        # Work queue columns: the text to embed and the lease of the worker holding the node
+        cursor.execute("ALTER TABLE embedding_progress ADD COLUMN IF NOT EXISTS node_name TEXT;")
+        cursor.execute("ALTER TABLE embedding_progress ADD COLUMN IF NOT EXISTS worker_id TEXT;")
+        cursor.execute("ALTER TABLE embedding_progress ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;")
+
+        # Index for faster lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_embedding_progress_session_status ON embedding_progress(session_id, status);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_embedding_progress_node_id ON embedding_progress(node_id);")
+
+        # Per-session counters
+        create_session_counters(cursor)
+    conn.commit()
+
+def choose_session(conn):
+    """A new session id, or the latest incomplete session when it is resumed"""
+    session_id = f"embedding_session_{int(time.time())}"
+    print(f"Starting embedding session: {session_id}")
+
+    # Check if we should resume a previous session
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT session_id, total, completed, failed
+            FROM embedding_sessions
+            WHERE pending + failed > 0
+            ORDER BY started_at DESC
+            LIMIT 1
+        """)
+        previous_session = cursor.fetchone()
+    conn.commit()
+    if not previous_session:
+        print(f"No previous incomplete sessions found. Starting new session: {session_id}")
+        return session_id
+
+    resume_session_id, total, completed, failed = previous_session
+    print(f"Found incomplete session: {resume_session_id}")
+    print(f"Progress: {completed}/{total} completed, {failed} failed")
+
+    # Check environment variable or use interactive prompt
+    force_resume = os.getenv('RESUME_SESSION', '').lower() in ['true', '1', 'yes', 'y']
+    force_new = os.getenv('NEW_SESSION', '').lower() in ['true', '1', 'yes', 'y']
+
+    if force_resume:
+        session_id = resume_session_id
+        print(f"Resuming session (RESUME_SESSION=true): {session_id}")
+    elif force_new:
+        print(f"Starting new session (NEW_SESSION=true): {session_id}")
+    else:
+        # Interactive prompt
+        response = input("Resume previous session? (y/n): ").lower().strip()
+        if response == 'y':
+            session_id = resume_session_id
+            print(f"Resuming session: {session_id}")
+        else:
+            print(f"Starting new session: {session_id}")
+    return session_id
+
+def add_vector_embeddings(incremental=False):
+    print("\nAdding vector embeddings...")
+    metrics.serve()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS vector')
+
+        # Commit the transaction so the extension is available
+        conn.commit()
+
+        # Register the vector types on this connection; new pooled connections get them in configure
+        register_vector(conn)
+
+        # Create tables for vector embeddings and progress tracking
+        print("Creating document_vectors, embedding_cache, embedding_progress and embedding_sessions tables...")
+        try:
+            create_embedding_tables(conn)
+            print("Tables created successfully")
+        except Exception as e:
+            conn.rollback()
+            print(f"Error creating tables: {str(e)}")
+            return
+
+        # Set up the embedding backend
+        try:
+            backend = create_embedding_backend(concurrent=True)
+        except Exception as e:
+            print(f"Error setting up {EMBEDDING_BACKEND} embedding backend: {str(e)}")
+            return
+        print(f"Embedding with {EMBEDDING_BACKEND} backend: {EMBEDDING_MODEL} ({EMBEDDING_DIMENSIONS} dimensions)")
+
+        # Generate or resume session ID
+        session_id = choose_session(conn)
+
+        # Get all vertex labels from the graph database
+        print("Retrieving vertex labels from graph database...")
+        try:
+            vertex_labels = get_vertex_labels(conn)
+
+            if not vertex_labels:
+                print("No vertex labels found in the graph")
+                return
+
+            print(f"Found {len(vertex_labels)} vertex label types")
+
+        except Exception as e:
+            print(f"Error retrieving vertex labels: {str(e)}")
+            return
+
+        # Initialize progress tracking on the server, once per session: compacted
+        # sessions no longer hold their completed rows, so tracking them again
+        # would queue every compacted node a second time
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT initialized_at FROM embedding_sessions WHERE session_id = %s", (session_id,))
+            row = cursor.fetchone()
+        if row is None or row[0] is None:
+            print("Initializing progress tracking...")
+            tracked = init_session_progress(conn, session_id, vertex_labels, incremental)
+            if incremental:
+                print(f"Progress tracking initialized for {tracked} new or changed nodes")
+            else:
+                print(f"Progress tracking initialized for {tracked} nodes")
+
+        try:
+            # Retry nodes that failed in an earlier run of this session
+            with conn.cursor() as cursor:
+                reset_failed_nodes(cursor, session_id)
+            conn.commit()
+
+            pending = count_pending_nodes(conn, session_id)
+            print(f"Found {pending} nodes to process")
+
+            # Bulk loads build the index once at the end instead of updating it on every insert
+            if pending >= BULK_INDEX_THRESHOLD:
+                drop_vector_indexes(conn)
+
+            # Nodes are claimed from embedding_progress, so workers started with
+            # `python node_embedder.py worker <session_id>` can share the session
+            process_session(conn, backend, session_id, pending)
+        finally:
+            backend.close()
+            # Make sure similarity searches have an ANN index (on every partition when partitioned),
+            # also when the session crashed or was interrupted after the bulk load dropped it.
+            # A connection of its own, since the session's may be broken.
+            try:
+                with connection() as index_conn:
+                    ensure_vector_indexes(index_conn)
+            except Exception as e:
+                print(f"Error building vector index: {str(e)}")
+
+        # Final progress report from the session counters
+        _, total_pending, total_final_completed, total_failed = session_counts(conn, session_id) or (0, 0, 0, 0)
+
+    print(f"\nSession {session_id} Summary:")
+    print(f"Successfully embedded: {total_final_completed}")
+    print(f"Failed: {total_failed}")
+    print(f"Still pending: {total_pending}")
+    print("Vector embeddings processing completed!")
+    metrics.report()
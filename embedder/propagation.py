@@ -0,0 +1,113 @@
+import numpy as np
+
+def build_adjacency(sources, targets, node_count):
+    """Undirected CSR adjacency (indptr, indices) from edge endpoint row indices.
+
+    Each edge is stored in both directions; indices are sorted by source row
+    so the neighbours of row i are indices[indptr[i]:indptr[i + 1]].
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    rows = np.concatenate([sources, targets])
+    columns = np.concatenate([targets, sources])
+    order = np.argsort(rows, kind='stable')
+    indices = columns[order].astype(np.int32)
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+    return indptr, indices
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+def neighbour_sums(current, indptr, indices, out, max_edges=100000):
+    """Write the sum of each row's neighbour vectors into out.
+
+    Edges are processed max_edges at a time, so memory stays bounded even
+    for hub nodes with millions of neighbours. Because edges are sorted by
+    row, each chunk covers a contiguous range of rows.
+    """
+    out[:] = 0
+    edge_count = int(indptr[-1])
+    for edge_start in range(0, edge_count, max_edges):
+        edge_end = min(edge_start + max_edges, edge_count)
+        # Rows owning the first and last edge of the chunk
+        first_row = int(np.searchsorted(indptr, edge_start, side='right')) - 1
+        last_row = int(np.searchsorted(indptr, edge_end - 1, side='right')) - 1
+        # Offsets of each row's first edge within the chunk, skipping rows with no edge in it
+        starts = np.clip(indptr[first_row:last_row + 1], edge_start, edge_end) - edge_start
+        present = np.diff(np.append(starts, edge_end - edge_start)) > 0
+        # Read neighbour vectors in row order (sequential on a memmap), then put them back in edge order
+        neighbours = indices[edge_start:edge_end]
+        order = np.argsort(neighbours, kind='stable')
+        gathered = np.empty((len(neighbours), current.shape[1]), dtype=np.float32)
+        gathered[order] = current[neighbours[order]]
+        sums = np.add.reduceat(gathered, starts[present], axis=0)
+        rows = np.arange(first_row, last_row + 1)[present]
+        out[rows] += sums
+    return out
+
+def propagate(current, indptr, indices, out, self_weight=0.5, block_rows=50000, max_edges=100000):
+    """One round of GraphSAGE-mean style propagation from current into out.
+
+    Each row becomes self_weight * its own vector + (1 - self_weight) * the
+    mean of its neighbours, L2-normalized. Rows without neighbours keep
+    their vector. current and out may be numpy memmaps.
+    """
+    neighbour_sums(current, indptr, indices, out, max_edges)
+    degrees = np.diff(indptr)
+    node_count = len(degrees)
+    for start in range(0, node_count, block_rows):
+        end = min(start + block_rows, node_count)
+        own = np.asarray(current[start:end], dtype=np.float32)
+        block_degrees = degrees[start:end]
+        means = np.asarray(out[start:end], dtype=np.float32) / np.maximum(block_degrees, 1)[:, None]
+        mixed = np.where(block_degrees[:, None] > 0, self_weight * own + (1 - self_weight) * means, own)
+        out[start:end] = normalize_rows(mixed)
+    return out
+
+def normalize_matrix(matrix, block_rows=50000):
+    """L2-normalize the rows of a (memory-mapped) matrix in place, one block at a time"""
+    for start in range(0, matrix.shape[0], block_rows):
+        matrix[start:start + block_rows] = normalize_rows(np.asarray(matrix[start:start + block_rows], dtype=np.float32))
+    return matrix
+
+def block_top_k(path, shape, start, end, k=10, threshold=0.0, corpus_rows=16384):
+    """Top-k cosine neighbours of rows start:end of the normalized float32 matrix at path.
+
+    Opened read-only by path so it can run in a worker process. The query
+    block is multiplied against the whole matrix corpus_rows at a time,
+    keeping a running top-k per row, so memory is bounded by
+    (end - start) * (k + corpus_rows) scores. Returns (sources, targets,
+    scores) of the pairs scoring at least threshold, self-pairs excluded.
+    """
+    matrix = np.memmap(path, dtype=np.float32, mode='r', shape=shape)
+    queries = np.asarray(matrix[start:end], dtype=np.float32)
+    query_count = end - start
+    best_scores = np.full((query_count, k), -np.inf, dtype=np.float32)
+    best_targets = np.full((query_count, k), -1, dtype=np.int64)
+    for corpus_start in range(0, shape[0], corpus_rows):
+        corpus_end = min(corpus_start + corpus_rows, shape[0])
+        scores = queries @ np.asarray(matrix[corpus_start:corpus_end], dtype=np.float32).T
+        # Rows of the query block that are also in this corpus block must not match themselves
+        overlap = np.arange(max(start, corpus_start), min(end, corpus_end))
+        scores[overlap - start, overlap - corpus_start] = -np.inf
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_targets = np.concatenate([best_targets, np.broadcast_to(
+            np.arange(corpus_start, corpus_end, dtype=np.int64), scores.shape)], axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_targets = np.take_along_axis(merged_targets, top, axis=1)
+    sources = np.repeat(np.arange(start, end, dtype=np.int64), k)
+    targets = best_targets.ravel()
+    scores = best_scores.ravel()
+    keep = (targets >= 0) & (scores >= threshold)
+    return sources[keep], targets[keep], scores[keep]
+
+def unique_pairs(sources, targets, scores, node_count):
+    """Keep one (low row, high row) copy of each symmetric pair"""
+    low = np.minimum(sources, targets)
+    high = np.maximum(sources, targets)
+    _, first = np.unique(low * node_count + high, return_index=True)
+    return low[first], high[first], scores[first]
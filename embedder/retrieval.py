@@ -0,0 +1,338 @@
+import json
+import time
+from embedder.db import GRAPH_NAME
+
+def label_filter_values(labels):
+    """Values matching the given labels in document_vectors.node_label.
+
+    node_label holds the agtype text of labels(v) (e.g. '["Drug"]'), so both
+    the bare label and its list form are accepted.
+    """
+    values = []
+    for label in labels:
+        values.extend([label, json.dumps([label])])
+    return values
+
+def partition_table(label):
+    """Name of the document_vectors partition holding one vertex label"""
+    return f"document_vectors_{label.lower()}"
+
+def label_partitions(cursor):
+    """Partition table names of a label-partitioned document_vectors (empty when not partitioned)"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('document_vectors')
+    """)
+    return {row[0] for row in cursor.fetchall()}
+
+def cypher_literal(node_id):
+    """Turn an agtype id read from document_vectors back into a Cypher literal"""
+    try:
+        value = json.loads(node_id)
+    except ValueError:
+        value = node_id
+    literal = json.dumps(value)
+    if '$$' in literal:
+        raise ValueError(f"Node id {node_id!r} cannot be used in a Cypher query")
+    return literal
+
+def label_name(node_label):
+    """Bare label of a stored node_label ('["Drug"]'), an agtype label ('"Drug"') or a bare label"""
+    try:
+        value = json.loads(node_label)
+    except (TypeError, ValueError):
+        return str(node_label)
+    if isinstance(value, list):
+        return str(value[0]) if value else ''
+    return str(value)
+
+def candidate_order(compact, operator, dimensions, query="%s::vector"):
+    """ORDER BY expression for the first pass, matching the ANN index expression.
+
+    query is the SQL expression of the query vector: a parameter by default,
+    or a column such as q.embedding in a LATERAL join.
+    """
+    if compact == 'halfvec':
+        return f"embedding::halfvec({dimensions}) {operator} {query}::halfvec({dimensions})"
+    if compact == 'bit':
+        return f"binary_quantize(embedding)::bit({dimensions}) <~> binary_quantize({query})::bit({dimensions})"
+    return f"embedding {operator} {query}"
+
+def knn_sources(labels=None, partitions=None):
+    """(table, label_clause, params) for each table a k-NN query searches.
+
+    When partitions (from label_partitions) holds a partition for every
+    requested label, each partition is searched without a label filter.
+    """
+    if labels and partitions and all(partition_table(label) in partitions for label in labels):
+        return [(partition_table(label), "", ()) for label in dict.fromkeys(labels)]
+    if labels:
+        return [("document_vectors", "WHERE node_label = ANY(%s)", (label_filter_values(labels),))]
+    return [("document_vectors", "", ())]
+
+def knn_search(cursor, query_vector, k=10, labels=None, operator='<=>', compact=None, rerank_factor=4,
+               partitions=None):
+    """Top-k nodes closest to query_vector, optionally restricted to some labels.
+
+    With a compact representation ('halfvec' or 'bit') the index is searched
+    for k * rerank_factor candidates, which are then re-ranked exactly
+    against the full-precision embedding column. When partitions (from
+    label_partitions) holds a partition for every requested label, each
+    partition's own ANN index is searched without a label filter and the
+    per-label results are merged.
+    Returns a list of (id, node_name, node_label, distance).
+    """
+    import numpy as np
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    sources = knn_sources(labels, partitions)
+    limit = k if compact is None else k * rerank_factor
+    order = f"embedding {operator} %s::vector" if compact is None else candidate_order(compact, operator, len(query_vector))
+    candidates = " UNION ALL ".join(f"""
+        (SELECT id, node_name, node_label, embedding
+         FROM {table}
+         {label_clause}
+         ORDER BY {order}
+         LIMIT %s)""" for table, label_clause, _ in sources)
+    params = []
+    for _, _, label_params in sources:
+        params.extend([*label_params, query_vector, limit])
+    # Exact distances over the merged candidates (a no-op re-sort for a single full-precision source)
+    cursor.execute(f"""
+        SELECT id, node_name, node_label, embedding {operator} %s::vector AS distance
+        FROM ({candidates}) candidates
+        ORDER BY distance
+        LIMIT %s
+    """, (query_vector, *params, k))
+    return cursor.fetchall()
+
+def batch_knn_search(cursor, query_vectors, k=10, labels=None, operator='<=>', compact=None, rerank_factor=4,
+                     partitions=None):
+    """knn_search for several query vectors in one round trip.
+
+    The vectors are sent as one array and unnested WITH ORDINALITY; a LATERAL
+    subquery runs the per-query candidate search and exact re-sort, so each
+    query still gets its own ANN index scan.
+    Returns one list of (id, node_name, node_label, distance) per query, in input order.
+    """
+    import numpy as np
+    query_vectors = [np.asarray(query_vector, dtype=np.float32) for query_vector in query_vectors]
+    if not query_vectors:
+        return []
+    sources = knn_sources(labels, partitions)
+    limit = k if compact is None else k * rerank_factor
+    order = candidate_order(compact, operator, len(query_vectors[0]), query="q.embedding")
+    candidates = " UNION ALL ".join(f"""
+            (SELECT id, node_name, node_label, embedding
+             FROM {table}
+             {label_clause}
+             ORDER BY {order}
+             LIMIT %s)""" for table, label_clause, _ in sources)
+    params = []
+    for _, _, label_params in sources:
+        params.extend([*label_params, limit])
+    cursor.execute(f"""
+        SELECT q.ord, c.id, c.node_name, c.node_label, c.distance
+        FROM unnest(%s::vector[]) WITH ORDINALITY AS q(embedding, ord)
+        CROSS JOIN LATERAL (
+            SELECT id, node_name, node_label, embedding {operator} q.embedding AS distance
+            FROM ({candidates}) candidates
+            ORDER BY distance
+            LIMIT %s
+        ) c
+        ORDER BY q.ord, c.distance
+    """, (query_vectors, *params, k))
+    hits = [[] for _ in query_vectors]
+    for ordinal, node_id, node_name, node_label, distance in cursor.fetchall():
+        hits[ordinal - 1].append((node_id, node_name, node_label, distance))
+    return hits
+
+def expand_neighbours(cursor, nodes, hops=1, max_neighbours=50):
+    """Neighbours up to `hops` edges away from every (node_id, node_label) in nodes, in one statement.
+
+    Ids are only unique within a label, so each label's start vertices are
+    matched in their own label table, one Cypher call per label. Each
+    (source, neighbour) pair is returned once at its shortest hop count, and
+    each source keeps at most max_neighbours of them, closest first (None for
+    no cap), so a hub among the hits cannot flood the ranking.
+    Returns a list of (source_id, source_label, neighbour_id, neighbour_name, neighbour_label, hops)
+    with bare label names.
+    """
+    ids_by_label = {}
+    for node_id, node_label in nodes:
+        ids_by_label.setdefault(label_name(node_label), []).append(node_id)
+    if not ids_by_label:
+        return []
+    expansions = []
+    for label, node_ids in ids_by_label.items():
+        if '`' in label or '$$' in label:
+            raise ValueError(f"Label {label!r} cannot be used in a Cypher query")
+        id_list = ', '.join(cypher_literal(node_id) for node_id in dict.fromkeys(node_ids))
+        expansions.append(f"""
+            SELECT * FROM cypher('{GRAPH_NAME}', $$
+                MATCH (v:`{label}`)-[e*1..{int(hops)}]-(n)
+                WHERE v.id IN [{id_list}] AND id(n) <> id(v)
+                RETURN v.id, label(v), n.id, coalesce(n.name, n.type), label(n), min(size(e))
+            $$) AS (source_id agtype, source_label agtype, neighbour_id agtype, neighbour_name agtype,
+                    neighbour_label agtype, hops agtype)""")
+    cap = f"WHERE neighbour_rank <= {int(max_neighbours)}" if max_neighbours is not None else ""
+    cursor.execute(f"""
+        SELECT source_id, source_label, neighbour_id, neighbour_name, neighbour_label, hops FROM (
+            SELECT *, row_number() OVER (PARTITION BY source_id, source_label
+                                         ORDER BY hops, neighbour_label, neighbour_id) AS neighbour_rank
+            FROM ({" UNION ALL ".join(expansions)}) expansions
+        ) neighbours
+        {cap};
+    """)
+    return [
+        (str(source_id), label_name(str(source_label)), str(neighbour_id), neighbour_name,
+         label_name(str(neighbour_label)), int(hop_count))
+        for source_id, source_label, neighbour_id, neighbour_name, neighbour_label, hop_count in cursor.fetchall()
+    ]
+
+def similarity(distance, operator):
+    """Map a pgvector distance to a score where higher is better"""
+    if operator == '<=>':
+        return 1 - distance
+    if operator == '<#>':
+        return -distance
+    return 1 / (1 + distance)
+
+def rank_results(hits, neighbours, operator='<=>', decay=0.5):
+    """Merge k-NN hits and their graph neighbours into one deduplicated ranking.
+
+    Hits score by similarity; a neighbour scores the best similarity of the
+    hits it was reached from times decay ** hops. Each (id, label) node
+    appears once, since ids are only unique within a label.
+    """
+    results = {}
+    for node_id, node_name, node_label, distance in hits:
+        node_key = (str(node_id), label_name(node_label))
+        results[node_key] = {
+            'id': str(node_id),
+            'name': node_name,
+            'label': node_key[1],
+            'score': similarity(distance, operator),
+            'hops': 0,
+            'via': [],
+        }
+    hit_scores = {node_key: result['score'] for node_key, result in results.items()}
+
+    reached_from = {}
+    for source_id, source_label, neighbour_id, neighbour_name, neighbour_label, hop_count in neighbours:
+        score = hit_scores.get((source_id, source_label), 0) * decay ** hop_count
+        node_key = (neighbour_id, neighbour_label)
+        result = results.get(node_key)
+        if result is None:
+            result = results[node_key] = {
+                'id': neighbour_id,
+                'name': neighbour_name,
+                'label': neighbour_label,
+                'score': score,
+                'hops': hop_count,
+                'via': [],
+            }
+        elif result['hops'] > 0 and score > result['score']:
+            result['score'] = score
+            result['hops'] = hop_count
+        sources = reached_from.setdefault(node_key, set())
+        if result['hops'] > 0 and (source_id, source_label) not in sources:
+            sources.add((source_id, source_label))
+            result['via'].append(source_id)
+
+    return sorted(results.values(), key=lambda result: result['score'], reverse=True)
+
+def hybrid_search(cursor, query_vector, k=10, hops=1, labels=None, operator='<=>', decay=0.5,
+                  compact=None, rerank_factor=4, partitions=None, max_neighbours=50):
+    """k-NN search on document_vectors followed by a batched graph expansion of the hits.
+
+    Returns (results, timings) where timings holds the latency of each stage
+    in milliseconds.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    hits = knn_search(cursor, query_vector, k, labels, operator, compact, rerank_factor, partitions)
+    timings['knn_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    neighbours = expand_neighbours(cursor, [(node_id, node_label) for node_id, _, node_label, _ in hits], hops,
+                                   max_neighbours) if hops > 0 else []
+    timings['expand_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    results = rank_results(hits, neighbours, operator, decay)
+    timings['rank_ms'] = (time.perf_counter() - start) * 1000
+
+    return results, timings
+
+def batch_hybrid_search(cursor, query_vectors, k=10, hops=1, labels=None, operator='<=>', decay=0.5,
+                        compact=None, rerank_factor=4, partitions=None, max_neighbours=50):
+    """hybrid_search for several query vectors: one k-NN round trip and one graph expansion for all hits.
+
+    Returns (results, timings) where results holds one ranking per query, in input order.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    hits = batch_knn_search(cursor, query_vectors, k, labels, operator, compact, rerank_factor, partitions)
+    timings['knn_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    hit_nodes = list(dict.fromkeys((node_id, label_name(node_label))
+                                   for query_hits in hits for node_id, _, node_label, _ in query_hits))
+    neighbours = expand_neighbours(cursor, hit_nodes, hops, max_neighbours) if hops > 0 else []
+    timings['expand_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    by_source = {}
+    for neighbour in neighbours:
+        by_source.setdefault((neighbour[0], neighbour[1]), []).append(neighbour)
+    results = [
+        rank_results(query_hits, [neighbour for node_id, _, node_label, _ in query_hits
+                                  for neighbour in by_source.get((str(node_id), label_name(node_label)), [])],
+                     operator, decay)
+        for query_hits in hits
+    ]
+    timings['rank_ms'] = (time.perf_counter() - start) * 1000
+
+    return results, timings
+
+def compare_search_modes(cursor, compacts, k=10, sample_size=100, operator='<=>', rerank_factor=4, indexed=None):
+    """Recall@k and latency of each compact search mode against exact search.
+
+    Query vectors are sampled from document_vectors, so no API calls are
+    needed. indexed holds the modes with a matching ANN index (all of them
+    when None); the others would only time a sequential scan, so they are
+    skipped and reported as {'indexed': False}.
+    Returns {mode: {'indexed': True, 'recall': ..., 'p50_ms': ..., 'p95_ms': ...}}.
+    """
+    import numpy as np
+    cursor.execute("SELECT embedding FROM document_vectors ORDER BY random() LIMIT %s", (sample_size,))
+    queries = [row[0] for row in cursor.fetchall()]
+
+    # Ground truth: exact distances with index scans disabled
+    cursor.execute("SET LOCAL enable_indexscan = off")
+    exact = [{row[0] for row in knn_search(cursor, query, k, operator=operator)} for query in queries]
+    cursor.connection.commit()
+
+    report = {}
+    for compact in compacts:
+        if indexed is not None and compact not in indexed:
+            report[compact or 'full'] = {'indexed': False}
+            continue
+        recalls = []
+        latencies = []
+        for query, truth in zip(queries, exact):
+            start = time.perf_counter()
+            hits = knn_search(cursor, query, k, operator=operator, compact=compact, rerank_factor=rerank_factor)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(truth & {row[0] for row in hits}) / max(len(truth), 1))
+        report[compact or 'full'] = {
+            'indexed': True,
+            'recall': float(np.mean(recalls)) if recalls else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if latencies else 0.0,
+            'p95_ms': float(np.percentile(latencies, 95)) if latencies else 0.0,
+        }
+    cursor.connection.commit()
+    return report
@@ -0,0 +1,89 @@
+import json
+import sys
+from embedder.config import metrics, EMBEDDING_DIMENSIONS, RERANK_FACTOR, DISTANCE_OPERATORS, vector_distance
+from embedder.db import connection
+from embedder.indexes import indexed_search_modes
+from embedder.retrieval import compare_search_modes
+from embedder.search_service import SearchService
+
+def print_results(query, results):
+    print(f"\nResults for: {query}")
+    print("=" * 80)
+    for result in results:
+        via = f" via {', '.join(result['via'])}" if result['via'] else ""
+        print(f"{result['score']:.4f}  [{result['label']}] {result['name']} ({result['id']}, {result['hops']} hops){via}")
+
+def print_cache_stats(service):
+    stats = service.stats()
+    print(f"Query cache: {stats['hits']} memory hits, {stats['persistent_hits']} persistent hits, "
+          f"{stats['embedded']} embedded ({stats['served_from_cache_rate'] * 100:.1f}% served from cache, "
+          f"{stats['size']}/{stats['max_size']} entries)")
+
+def search_nodes(query, k=10, hops=1, labels=None):
+    """Hybrid vector + graph search for query text (or a JSON vector), printing ranked results"""
+    service = SearchService()
+    try:
+        if query.lstrip().startswith('['):
+            results, timings = service.search_vector(json.loads(query), k=k, hops=hops, labels=labels)
+        else:
+            results, timings = service.search(query, k=k, hops=hops, labels=labels)
+    finally:
+        service.close()
+
+    print_results(query, results)
+    print("-" * 40)
+    print("Latency: " + ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in timings.items()))
+
+def batch_search_nodes(path, k=10, hops=1, labels=None):
+    """Search every query of a file (one per line, - for stdin) with one embedding pass and one k-NN round trip"""
+    if path == '-':
+        queries = [line.strip() for line in sys.stdin]
+    else:
+        with open(path) as queries_file:
+            queries = [line.strip() for line in queries_file]
+    queries = [query for query in queries if query]
+    if not queries:
+        print("No queries to search.")
+        return
+
+    metrics.serve()
+    service = SearchService()
+    try:
+        results, timings = service.batch_search(queries, k=k, hops=hops, labels=labels)
+    finally:
+        service.close()
+
+    for query, query_results in zip(queries, results):
+        print_results(query, query_results)
+    print("-" * 40)
+    print(f"{len(queries)} queries. Latency: " + ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in timings.items()))
+    print_cache_stats(service)
+    metrics.report()
+
+# Profile whose `reindex` builds the index of each search mode
+MODE_PROFILES = {'full': 'full', 'halfvec': 'halfvec', 'bit': 'binary'}
+
+def compare_storage_profiles(k=10, sample_size=100):
+    """Print recall@k and latency of full, halfvec and binary search against exact search.
+
+    Modes without a matching ANN index are listed but not measured. The small
+    profile is the halfvec mode of a 512-dimension table, so it is compared by
+    running this with STORAGE_PROFILE=small against that table.
+    """
+    compacts = [None, 'halfvec', 'bit']
+    with connection() as conn:
+        indexed = indexed_search_modes(conn, compacts)
+        with conn.cursor() as cursor:
+            report = compare_search_modes(
+                cursor, compacts, k=k, sample_size=sample_size,
+                operator=DISTANCE_OPERATORS[vector_distance()], rerank_factor=RERANK_FACTOR, indexed=indexed
+            )
+    print(f"\nSearch modes compared on {sample_size} sampled queries "
+          f"({EMBEDDING_DIMENSIONS} dimensions, k={k}, rerank factor {RERANK_FACTOR}):")
+    print("=" * 80)
+    for mode, stats in report.items():
+        if not stats['indexed']:
+            print(f"{mode:10} skipped: no matching index (build it with STORAGE_PROFILE={MODE_PROFILES[mode]} reindex)")
+            continue
+        print(f"{mode:10} recall@{k}: {stats['recall']:.3f}  p50: {stats['p50_ms']:.1f}ms  p95: {stats['p95_ms']:.1f}ms")
+    print(json.dumps(report))
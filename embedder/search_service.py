@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from embedder.config import (metrics, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, VECTOR_COMPACT, RERANK_FACTOR,
+                             MAX_NEIGHBOURS, DISTANCE_OPERATORS, vector_distance, create_embedding_backend)
+from embedder.db import connection
+from embedder.embedding import content_hash, pack_embedding_batches, embed_texts
+from embedder.retrieval import label_partitions, hybrid_search, batch_hybrid_search
+
+# Query embeddings kept in memory: at most QUERY_CACHE_SIZE texts, each for QUERY_CACHE_TTL seconds
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 10000))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 3600))
+# Also look up and store query embeddings in embedding_cache, shared by every process
+QUERY_CACHE_PERSISTENT = os.getenv('QUERY_CACHE_PERSISTENT', '').lower() in ['true', '1', 'yes', 'y']
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query embeddings keyed by content_hash, with a time to live.
+
+    Counts hits, misses and expired entries so the size and TTL can be tuned
+    from the observed hit rate.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = QUERY_CACHE_SIZE if max_size is None else max_size
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, embedding):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class SearchService:
+    """Embeds query texts through the cache layers and runs searches on pooled connections.
+
+    Lookups go to the in-process LRU first, then (with QUERY_CACHE_PERSISTENT)
+    to embedding_cache, and only the remaining texts are sent to the backend,
+    all of them in as few requests as the batch limits allow. One service can
+    be shared by several threads.
+    """
+
+    def __init__(self, cache=None, persistent=None):
+        self.cache = QueryEmbeddingCache() if cache is None else cache
+        self.persistent = QUERY_CACHE_PERSISTENT if persistent is None else persistent
+        self.operator = DISTANCE_OPERATORS[vector_distance()]
+        self.backend = None
+        self.lock = threading.Lock()
+        self.persistent_hits = 0
+        self.embedded = 0
+
+    def get_backend(self):
+        with self.lock:
+            if self.backend is None:
+                self.backend = create_embedding_backend()
+            return self.backend
+
+    def close(self):
+        with self.lock:
+            if self.backend is not None:
+                self.backend.close()
+                self.backend = None
+
+    def lookup_persistent(self, hashes):
+        """Embeddings stored in embedding_cache for the given hashes, as {hash: embedding}"""
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT content_hash, embedding FROM embedding_cache WHERE content_hash = ANY(%s)
+            """, (hashes,))
+            return dict(cursor.fetchall())
+
+    def store_persistent(self, embedded):
+        """Remember new (hash, embedding) pairs in embedding_cache for other processes"""
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO embedding_cache (content_hash, model, dimensions, embedding)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (content_hash) DO NOTHING
+            """, [(text_hash, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, embedding)
+                  for text_hash, embedding in embedded])
+
+    def embed_queries(self, queries):
+        """Embedding of every query text, in input order, calling the backend only for uncached texts"""
+        hashes = [content_hash(query) for query in queries]
+        found = {}
+        for text_hash in dict.fromkeys(hashes):
+            embedding = self.cache.get(text_hash)
+            if embedding is not None:
+                found[text_hash] = embedding
+        metrics.inc('query_cache_lookups', len(set(hashes)))
+        metrics.inc('query_cache_hits', len(found), layer='memory')
+
+        missing = [text_hash for text_hash in dict.fromkeys(hashes) if text_hash not in found]
+        if missing and self.persistent:
+            with metrics.timer('stage_seconds', stage='query_cache_lookup'):
+                stored = self.lookup_persistent(missing)
+            metrics.inc('query_cache_hits', len(stored), layer='persistent')
+            with self.lock:
+                self.persistent_hits += len(stored)
+            for text_hash, embedding in stored.items():
+                self.cache.put(text_hash, embedding)
+            found.update(stored)
+            missing = [text_hash for text_hash in missing if text_hash not in found]
+
+        if missing:
+            text_of = {text_hash: query for text_hash, query in zip(hashes, queries)}
+            backend = self.get_backend()
+            embedded = []
+            for batch in pack_embedding_batches(missing, text_of=text_of.get):
+                embeddings = embed_texts(backend, [text_of[text_hash] for text_hash in batch])
+                embedded.extend(zip(batch, embeddings))
+            metrics.inc('query_embeddings', len(embedded))
+            with self.lock:
+                self.embedded += len(embedded)
+            for text_hash, embedding in embedded:
+                self.cache.put(text_hash, embedding)
+                found[text_hash] = embedding
+            if self.persistent:
+                self.store_persistent(embedded)
+
+        return [found[text_hash] for text_hash in hashes]
+
+    def search(self, query, k=10, hops=1, labels=None):
+        """Hybrid search for one query text. Returns (results, timings)"""
+        start = time.perf_counter()
+        query_vector = self.embed_queries([query])[0]
+        embed_ms = (time.perf_counter() - start) * 1000
+        results, timings = self.search_vector(query_vector, k, hops, labels)
+        return results, {'embed_ms': embed_ms, **timings}
+
+    def search_vector(self, query_vector, k=10, hops=1, labels=None):
+        """Hybrid search for an already embedded query. Returns (results, timings)"""
+        with connection() as conn, conn.cursor() as cursor:
+            return hybrid_search(
+                cursor, query_vector, k=k, hops=hops, labels=labels, operator=self.operator,
+                compact=VECTOR_COMPACT, rerank_factor=RERANK_FACTOR, max_neighbours=MAX_NEIGHBOURS,
+                partitions=label_partitions(cursor) if labels else None
+            )
+
+    def batch_search(self, queries, k=10, hops=1, labels=None):
+        """Hybrid search for many query texts with one embedding pass and one k-NN round trip.
+
+        Returns (results, timings) where results holds one ranking per query, in input order.
+        """
+        start = time.perf_counter()
+        query_vectors = self.embed_queries(queries)
+        timings = {'embed_ms': (time.perf_counter() - start) * 1000}
+        with connection() as conn, conn.cursor() as cursor:
+            results, search_timings = batch_hybrid_search(
+                cursor, query_vectors, k=k, hops=hops, labels=labels, operator=self.operator,
+                compact=VECTOR_COMPACT, rerank_factor=RERANK_FACTOR, max_neighbours=MAX_NEIGHBOURS,
+                partitions=label_partitions(cursor) if labels else None
+            )
+        timings.update(search_timings)
+        return results, timings
+
+    def stats(self):
+        """LRU stats plus persistent hits, API embeddings and the share of lookups served without an API call"""
+        stats = self.cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['persistent_hits'] = self.persistent_hits
+        stats['embedded'] = self.embedded
+        stats['served_from_cache_rate'] = (stats['hits'] + self.persistent_hits) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,257 @@
+import os
+from embedder.db import connection
+
+# Per-session counters, kept up to date by statement-level triggers on
+# embedding_progress so progress reports never scan the history table
+SESSION_COUNTS_UPSERT = """
+    INSERT INTO embedding_sessions AS s (session_id, total, pending, completed, failed)
+    SELECT session_id, SUM(delta),
+           COALESCE(SUM(delta) FILTER (WHERE status = 'pending'), 0),
+           COALESCE(SUM(delta) FILTER (WHERE status = 'completed'), 0),
+           COALESCE(SUM(delta) FILTER (WHERE status = 'failed'), 0)
+    FROM ({changes}) changes
+    GROUP BY session_id
+    ON CONFLICT (session_id) DO UPDATE SET
+        total = s.total + EXCLUDED.total,
+        pending = s.pending + EXCLUDED.pending,
+        completed = s.completed + EXCLUDED.completed,
+        failed = s.failed + EXCLUDED.failed,
+        updated_at = CURRENT_TIMESTAMP;
+"""
+
+def create_session_counters(cursor):
+    """Create embedding_sessions and the triggers that maintain it"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_sessions (
+            session_id TEXT PRIMARY KEY,
+            total BIGINT NOT NULL DEFAULT 0,
+            pending BIGINT NOT NULL DEFAULT 0,
+            completed BIGINT NOT NULL DEFAULT 0,
+            failed BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            compacted_at TIMESTAMP
+        );
+    """)
+    # Set once every label of the session is tracked, so resumes never track its nodes again
+    cursor.execute("ALTER TABLE embedding_sessions ADD COLUMN IF NOT EXISTS initialized_at TIMESTAMP;")
+    # Sessions compacted by older versions were fully tracked
+    cursor.execute("""
+        UPDATE embedding_sessions SET initialized_at = compacted_at
+        WHERE initialized_at IS NULL AND compacted_at IS NOT NULL
+    """)
+    
+    inserted = "SELECT session_id, status, 1 AS delta FROM new_rows"
+    # Only rows whose status changed move between counters
+    updated = """
+        SELECT n.session_id, c.status, c.delta
+        FROM new_rows n JOIN old_rows o USING (id),
+             LATERAL (VALUES (n.status, 1), (o.status, -1)) AS c(status, delta)
+        WHERE n.status IS DISTINCT FROM o.status
+    """
+    # Rows removed by compaction stay counted
+    deleted = """
+        SELECT o.session_id, o.status, -1 AS delta
+        FROM old_rows o JOIN embedding_sessions es USING (session_id)
+        WHERE es.compacted_at IS NULL
+    """
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION embedding_progress_counts() RETURNS trigger AS $body$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {SESSION_COUNTS_UPSERT.format(changes=inserted)}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {SESSION_COUNTS_UPSERT.format(changes=updated)}
+            ELSE
+                {SESSION_COUNTS_UPSERT.format(changes=deleted)}
+            END IF;
+            RETURN NULL;
+        END;
+        $body$ LANGUAGE plpgsql;
+    """)
+    
+    cursor.execute("""
+        SELECT COUNT(*) FROM pg_trigger
+        WHERE tgrelid = 'embedding_progress'::regclass AND tgname LIKE 'embedding_progress_counts_%'
+    """)
+    if cursor.fetchone()[0] == 0:
+        # Transition tables need one trigger per event
+        for event, transitions in [('INSERT', 'NEW TABLE AS new_rows'),
+                                   ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                   ('DELETE', 'OLD TABLE AS old_rows')]:
+            cursor.execute(f"""
+                CREATE TRIGGER embedding_progress_counts_{event.lower()}
+                AFTER {event} ON embedding_progress
+                REFERENCING {transitions}
+                FOR EACH STATEMENT EXECUTE FUNCTION embedding_progress_counts();
+            """)
+        # Count sessions recorded before the triggers existed
+        cursor.execute("""
+            INSERT INTO embedding_sessions (session_id, total, pending, completed, failed, started_at, updated_at)
+            SELECT session_id, COUNT(*),
+                   COUNT(*) FILTER (WHERE status = 'pending'),
+                   COUNT(*) FILTER (WHERE status = 'completed'),
+                   COUNT(*) FILTER (WHERE status = 'failed'),
+                   MIN(created_at), MAX(updated_at)
+            FROM embedding_progress
+            GROUP BY session_id
+            ON CONFLICT (session_id) DO NOTHING
+        """)
+
+def session_counts(conn, session_id):
+    """Return (total, pending, completed, failed) for a session, or None if it is unknown"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT total, pending, completed, failed FROM embedding_sessions WHERE session_id = %s
+        """, (session_id,))
+        counts = cursor.fetchone()
+    conn.commit()
+    return counts
+
+def count_pending_nodes(conn, session_id):
+    counts = session_counts(conn, session_id)
+    return counts[1] if counts else 0
+
+def mark_session_initialized(conn, session_id):
+    """Record that progress tracking of a session is complete"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO embedding_sessions (session_id, initialized_at) VALUES (%s, CURRENT_TIMESTAMP)
+            ON CONFLICT (session_id) DO UPDATE SET initialized_at = EXCLUDED.initialized_at
+        """, (session_id,))
+    conn.commit()
+
+def reset_failed_nodes(cursor, session_id):
+    """Put the failed nodes of a session back to pending and return how many were reset.
+
+    A compacted session is reopened, so compact deletes the retried rows once
+    they complete; initialized_at keeps resumes from tracking it again.
+    """
+    cursor.execute("""
+        UPDATE embedding_progress
+        SET status = 'pending', error_message = NULL, worker_id = NULL, lease_expires_at = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE session_id = %s AND status = 'failed'
+    """, (session_id,))
+    reset_count = cursor.rowcount
+    if reset_count:
+        cursor.execute("""
+            UPDATE embedding_sessions SET compacted_at = NULL WHERE session_id = %s
+        """, (session_id,))
+    return reset_count
+
+def ensure_session_counters():
+    """Build the counters on first use, for sessions recorded by older versions.
+
+    Only reads the catalog when they already exist, so status commands take
+    no DDL locks while a session is running.
+    """
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT to_regclass('embedding_progress') IS NULL
+                OR (EXISTS (SELECT 1 FROM pg_attribute
+                            WHERE attrelid = to_regclass('embedding_sessions')
+                            AND attname = 'initialized_at' AND NOT attisdropped)
+                    AND EXISTS (SELECT 1 FROM pg_trigger
+                                WHERE tgrelid = to_regclass('embedding_progress')
+                                AND tgname LIKE 'embedding_progress_counts_%'))
+        """)
+        if cursor.fetchone()[0]:
+            return
+        create_session_counters(cursor)
+
+# Rows deleted per transaction when compacting a session
+COMPACT_BATCH_SIZE = int(os.getenv('COMPACT_BATCH_SIZE', 50000))
+
+def compact_sessions(session_id=None):
+    """Delete the completed rows of finished sessions, keeping their counters and failed rows"""
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE embedding_sessions
+            SET compacted_at = CURRENT_TIMESTAMP
+            WHERE pending = 0 AND compacted_at IS NULL
+            AND (%(session_id)s::text IS NULL OR session_id = %(session_id)s)
+            RETURNING session_id
+        """, {'session_id': session_id})
+        sessions = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        
+        if not sessions:
+            print("No finished sessions to compact.")
+            return
+        
+        for finished_session in sessions:
+            deleted = 0
+            # Delete in chunks to keep transactions and WAL bursts short
+            while True:
+                cursor.execute("""
+                    DELETE FROM embedding_progress
+                    WHERE id IN (
+                        SELECT id FROM embedding_progress
+                        WHERE session_id = %s AND status = 'completed'
+                        LIMIT %s
+                    )
+                """, (finished_session, COMPACT_BATCH_SIZE))
+                conn.commit()
+                if cursor.rowcount == 0:
+                    break
+                deleted += cursor.rowcount
+            print(f"Compacted session {finished_session}: removed {deleted} completed rows")
+
+def check_embedding_progress():
+    """Check progress of all embedding sessions"""
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT session_id, total, completed, failed, pending, started_at, updated_at, compacted_at
+            FROM embedding_sessions
+            ORDER BY started_at DESC
+        """)
+        sessions = cursor.fetchall()
+    
+    if not sessions:
+        print("No embedding sessions found.")
+        return
+    
+    print("\nEmbedding Sessions Progress:")
+    print("=" * 80)
+    for session_id, total, completed, failed, pending, started_at, last_updated, compacted_at in sessions:
+        completion_rate = (completed / total * 100) if total > 0 else 0
+        print(f"Session: {session_id}")
+        print(f"  Started: {started_at}")
+        print(f"  Last Updated: {last_updated}")
+        print(f"  Progress: {completed}/{total} ({completion_rate:.1f}%)")
+        print(f"  Failed: {failed}, Pending: {pending}")
+        if compacted_at:
+            print(f"  Compacted: {compacted_at}")
+        print("-" * 40)
+
+def cleanup_failed_nodes(session_id):
+    """Reset failed nodes to pending status for retry"""
+    with connection() as conn, conn.cursor() as cursor:
+        updated_count = reset_failed_nodes(cursor, session_id)
+    print(f"Reset {updated_count} failed nodes to pending status")
+
+def get_failed_nodes_summary(session_id):
+    """Get summary of failed nodes by error type"""
+    with connection() as conn:
+        counts = session_counts(conn, session_id)
+        if not counts or counts[3] == 0:
+            print(f"No failures found for session {session_id}")
+            return
+        
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT error_message, COUNT(*) as count
+                FROM embedding_progress 
+                WHERE session_id = %s AND status = 'failed'
+                GROUP BY error_message
+                ORDER BY count DESC
+            """, (session_id,))
+            failures = cursor.fetchall()
+    
+    if failures:
+        print(f"\nFailure summary for session {session_id}:")
+        for error_msg, count in failures:
+            print(f"  {error_msg}: {count} nodes")
+    else:
+        print(f"No failures found for session {session_id}")